@@ -0,0 +1,347 @@
+import heapq
+import itertools
+import math
+import os
+from collections import deque
+
+from pygears.conf import Inject, inject
+from pygears.core.intf import Intf
+from pygears.sim import timestep as sim_timestep
+
+
+@inject
+def sim_intfs(root=Inject('gear/root')):
+    """Returns all the interfaces of the design, in the order of the design
+    hierarchy. The order is the same in all the processes forked after the
+    design was elaborated, so the interfaces can be passed between them by
+    their indices.
+    """
+
+    intfs = {}
+    stack = [root]
+    while stack:
+        g = stack.pop()
+        for p in g.in_ports + g.out_ports:
+            for i in (p.producer, p.consumer):
+                if isinstance(i, Intf):
+                    intfs.setdefault(i, None)
+
+        for i in g.local_intfs:
+            intfs.setdefault(i, None)
+
+        stack.extend(reversed(g.child))
+
+    return list(intfs)
+
+
+def _map_intfs(val, func):
+    if isinstance(val, (tuple, list)):
+        return tuple(func(v) for v in val)
+
+    return func(val)
+
+
+def sim_intf(intf):
+    """Returns the interface whose events fire during the simulation, since
+    the interfaces connecting the hierarchical gears are not simulated.
+    """
+
+    end = intf.end_producer
+    return intf if end is None else end[0]
+
+
+_keys = itertools.count()
+
+
+class Breakpoint:
+    """Base of the typed breakpoints. A breakpoint is armed once from the
+    simulator thread, after which it either schedules timesteps at which it
+    is to be checked, or hooks into the interface events and fires by
+    itself.
+
+    Breakpoints are pickled with the interfaces they refer to, listed in
+    intf_attrs, replaced by their indices in sim_intfs().
+    """
+
+    intf_attrs = ()
+
+    def __init__(self):
+        self.enabled = True
+        self.engine = None
+
+        # Identifies the breakpoint together with its copies pickled to the
+        # simulator process
+        self.key = (os.getpid(), next(_keys))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['engine'] = None
+
+        ids = {intf: i for i, intf in enumerate(sim_intfs())}
+        for name in self.intf_attrs:
+            state[name] = _map_intfs(state[name], ids.__getitem__)
+
+        return state
+
+    def __setstate__(self, state):
+        intfs = sim_intfs()
+        for name in self.intf_attrs:
+            state[name] = _map_intfs(state[name], intfs.__getitem__)
+
+        self.__dict__.update(state)
+
+    def arm(self, engine, timestep):
+        self.engine = engine
+
+    def expired(self, timestep, tag):
+        """Called when the timestep scheduled with the tag is reached. Returns
+        whether the simulation should break."""
+        return True
+
+    def disable(self):
+        self.enabled = False
+
+
+class TimestepBreakpoint(Breakpoint):
+    def __init__(self, timestep):
+        super().__init__()
+        self.timestep = timestep
+
+    def arm(self, engine, timestep):
+        super().arm(engine, timestep)
+        engine.schedule(self.timestep, self)
+
+
+class StepsBreakpoint(TimestepBreakpoint):
+    def __init__(self, steps=1, start=None):
+        # Counted from the timestep at which the simulation currently stands,
+        # which is None if it has not simulated any timestep yet
+        if start is None:
+            start = -1
+
+        super().__init__(start + steps)
+
+
+class HandshakeBreakpoint(Breakpoint):
+    """Breaks after the data is handshaked on the interface."""
+
+    intf_attrs = ('intf', )
+
+    def __init__(self, intf, keep=False):
+        super().__init__()
+        self.intf = intf
+        self.keep = keep
+
+    def arm(self, engine, timestep):
+        super().arm(engine, timestep)
+        sim_intf(self.intf).events['ack'].append(self.handshake)
+
+    def handshake(self, intf):
+        if not self.enabled:
+            return False
+
+        self.engine.fire(self)
+        if not self.keep:
+            self.disable()
+
+        return self.keep
+
+
+class StuckBreakpoint(Breakpoint):
+    """Breaks when a node holds some of the data on its input interfaces for
+    the given number of cycles, without outputting anything to its output
+    interfaces, the same as the stall scan.
+    """
+
+    intf_attrs = ('inputs', 'outputs')
+
+    def __init__(self, inputs, outputs, cycles, keep=False):
+        super().__init__()
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.cycles = cycles
+        self.keep = keep
+        self.waiting = set()
+        self.valid = set()
+        self.generation = 0
+        self.stuck = False
+
+    def arm(self, engine, timestep):
+        super().arm(engine, timestep)
+
+        for intfs, state in ((self.inputs, self.waiting), (self.outputs, self.valid)):
+            for i in intfs:
+                events = sim_intf(i).events
+                events['put'].append((self.put, state, i))
+                events['ack'].append((self.ack, state, i))
+
+    def put(self, state, key, intf, val):
+        state.add(key)
+        return self.update()
+
+    def ack(self, state, key, intf):
+        state.discard(key)
+        return self.update()
+
+    def update(self):
+        if not self.enabled:
+            return False
+
+        stuck = bool(self.waiting) and not self.valid
+        if stuck != self.stuck:
+            self.stuck = stuck
+
+            # The timesteps scheduled for the previous stuck intervals are
+            # recognized by their generation and ignored
+            self.generation += 1
+            if stuck:
+                self.engine.schedule(sim_timestep() + self.cycles, self, self.generation)
+
+        return True
+
+    def expired(self, timestep, tag):
+        if tag != self.generation:
+            return False
+
+        if not self.keep:
+            self.disable()
+
+        return True
+
+
+class RemovedBreakpoint:
+    def __init__(self, bp):
+        self.key = bp.key
+
+
+class BreakpointEngine:
+    """Decides when the simulation breaks. Timestep breakpoints are kept in a
+    heap keyed by their target timestep, and the interface breakpoints fire
+    from the interface events, so that in the timesteps in which no
+    breakpoint is due, the simulator only compares the timestep with due.
+
+    Breakpoints are added from the GUI thread only through the pending
+    queue, and everything else is handled in the simulator thread.
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.seq = itertools.count()
+        self.pending = deque()
+        self.fired = []
+        self.armed = set()
+        self.polled = set()
+        self.pause_requested = False
+        self.due = math.inf
+
+    def add(self, bp):
+        """Adds either a typed breakpoint or a callable returning (trig, keep),
+        which is polled in each timestep until it is discarded."""
+        self.pending.append(bp)
+        self.due = -math.inf
+
+    def pause(self):
+        self.pause_requested = True
+        self.due = -math.inf
+
+    def clear(self):
+        self.add(None)
+
+    def replace(self, bps):
+        self.clear()
+        for bp in bps:
+            self.add(bp)
+
+    def remove(self, bp):
+        """Removes the breakpoint, given either by itself or by its copy."""
+        bp.disable()
+        self.add(RemovedBreakpoint(bp))
+
+    def schedule(self, timestep, bp, tag=None):
+        heapq.heappush(self.heap, (timestep, next(self.seq), bp, tag))
+        self.due = min(self.due, timestep)
+
+    def fire(self, bp):
+        self.fired.append(bp)
+        self.due = -math.inf
+
+    def arm(self, timestep):
+        while self.pending:
+            bp = self.pending.popleft()
+            if bp is None:
+                self.disable_all()
+            elif isinstance(bp, RemovedBreakpoint):
+                self.disable_key(bp.key)
+            elif isinstance(bp, Breakpoint):
+                self.armed.add(bp)
+                bp.arm(self, timestep)
+            else:
+                self.polled.add(bp)
+
+    def disable_all(self):
+        # Disabled breakpoints unhook from the interface events the next time
+        # they are triggered
+        for bp in self.armed:
+            bp.disable()
+
+        self.armed.clear()
+        self.heap.clear()
+        self.fired.clear()
+        self.polled.clear()
+
+    def disable_key(self, key):
+        for bp in self.armed:
+            if bp.key == key:
+                bp.disable()
+
+        self.armed = {bp for bp in self.armed if bp.key != key}
+
+    def poll(self):
+        triggered = False
+        discard = []
+
+        for b in self.polled:
+            trig, keep = b()
+            if trig:
+                triggered = True
+
+            if not keep:
+                discard.append(b)
+
+        self.polled.difference_update(discard)
+
+        return triggered
+
+    def check(self, timestep):
+        self.arm(timestep)
+
+        triggered = self.pause_requested
+        if triggered:
+            self.pause_requested = False
+
+        heap = self.heap
+        while heap and heap[0][0] <= timestep:
+            _, _, bp, tag = heapq.heappop(heap)
+            if bp.enabled and bp.expired(timestep, tag):
+                triggered = True
+
+        if self.fired:
+            self.fired.clear()
+            triggered = True
+
+        if self.polled and self.poll():
+            triggered = True
+
+        if self.polled:
+            self.due = -math.inf
+        elif heap:
+            self.due = heap[0][0]
+        else:
+            self.due = math.inf
+
+        # The GUI thread might have added a breakpoint after it was checked
+        # for above, in which case its lowering of due was overwritten
+        if self.pending or self.pause_requested or self.fired:
+            self.due = -math.inf
+
+        return triggered
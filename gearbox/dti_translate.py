@@ -15,42 +15,75 @@ $finish"""
 state_code = {0: '', 1: '?DarkRed?V', 2: '?DarkBlue?R', 3: '?DarkGreen?H'}
 
 
-def dump_seq(seq):
-    # print(f'$name {name}', flush=True)
-    print(f'$name --')
-    for i, state in seq.items():
-        print(f'#{i*10} {state_code[state]}')
-
-    print('$finish')
-
-
-cur_time = 0
-max_time = 0
-seq = {0: 0}
-cur_val = [0, 0]
-for line in sys.stdin:
-    if line.startswith('$'):
-        if 'data_end' in line:
-            dump_seq(seq)
-            seq = {0: 0}
-            cur_time = 0
-            sys.stdout.flush()
-            continue
-        elif line.startswith('$comment name'):
-            name = line.split()[2]
-        else:
-            continue
-    elif line.startswith('#'):
-        next_time = int(line[1:]) // 10
-        if seq[cur_time] == 3:
-            for t in range(cur_time + 1, next_time):
-                seq[t] = seq[cur_time]
-        cur_time = next_time
-    else:
-        val = int(line[0])
-        pos = int(line[1]) - 1
-        cur_val[pos] = val
-
-        seq[cur_time] = (cur_val[1] << 1) + cur_val[0]
-
-        # seq[cur_time] = int(line.split()[0][1:], 2)
+class DTITranslator:
+    """Streams the transaction states of one signal group at a time.
+
+    States are written out as soon as the time advances past them, and only
+    when they change. The exception is the handshake state, which is repeated
+    for every timestep it is held, since each of them is a separate
+    transaction. Nothing is accumulated, so the memory used does not depend on
+    the simulation length.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.reset()
+
+    def reset(self):
+        self.started = False
+        self.cur_time = 0
+        self.cur_val = [0, 0]
+        self.state = 0
+        self.emitted = None
+
+    def emit(self, time, state):
+        self.out.write(f'#{time*10} {state_code[state]}\n')
+        self.emitted = state
+
+    def start(self):
+        if not self.started:
+            self.out.write('$name --\n')
+            self.started = True
+
+    def advance(self, next_time):
+        self.start()
+
+        if self.state != self.emitted or self.state == 3:
+            self.emit(self.cur_time, self.state)
+
+        if self.state == 3:
+            for t in range(self.cur_time + 1, next_time):
+                self.emit(t, self.state)
+
+        self.cur_time = next_time
+
+    def finish(self):
+        self.start()
+
+        if self.state != self.emitted or self.state == 3:
+            self.emit(self.cur_time, self.state)
+
+        self.out.write('$finish\n')
+        self.out.flush()
+        self.reset()
+
+    def feed(self, line):
+        if line.startswith('$'):
+            if 'data_end' in line:
+                self.finish()
+        elif line.startswith('#'):
+            next_time = int(line[1:]) // 10
+            if next_time != self.cur_time:
+                self.advance(next_time)
+        elif line.strip():
+            val = int(line[0] == '1')
+            pos = int(line[1:]) - 1
+            self.cur_val[pos] = val
+
+            self.state = (self.cur_val[1] << 1) + self.cur_val[0]
+
+
+if __name__ == '__main__':
+    translator = DTITranslator(sys.stdout)
+    for line in sys.stdin:
+        translator.feed(line)
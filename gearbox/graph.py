@@ -13,6 +13,7 @@ from .scene import NodeScene
 from .node import NodeItem
 from .node_model import NodeModel, find_cosim_modules
 from .layout import Buffer, LayoutPlugin
+from .layout_sched import cancel_layout
 from .html_utils import tabulate, fontify
 from .utils import single_shot_connect
 
@@ -41,6 +42,18 @@ class GraphVisitor:
         pass
 
 
+def expand_to(model):
+    parents = []
+    node = model.parent
+    while node is not None:
+        parents.append(node)
+        node = node.parent
+
+    for node in reversed(parents):
+        if node.view.collapsed:
+            node.view.expand()
+
+
 class GraphBuffer(Buffer):
     @property
     def domain(self):
@@ -106,8 +119,8 @@ class GraphModelCtrl(QtCore.QObject):
         top_model = NodeModel(root)
         reg['gearbox/graph_model'] = top_model
         view.top = top_model.view
+        single_shot_connect(view.layout_finished, view.fit_all)
         top_model.view.layout()
-        view.fit_all()
 
         self.buff = GraphBuffer(view, 'graph')
 
@@ -122,6 +135,7 @@ class GraphModelCtrl(QtCore.QObject):
 
     def graph_delete(self):
         print(f'Deleting graph')
+        cancel_layout(self.buff.view.top)
         self.buff.delete()
         del self.buff
         reg['gearbox/graph'] = None
@@ -138,6 +152,7 @@ class Graph(QtWidgets.QGraphicsView):
     node_selected = QtCore.Signal(str)
     resized = QtCore.Signal()
     node_expand_toggled = QtCore.Signal(bool, object)
+    layout_finished = QtCore.Signal()
 
     @inject
     def __init__(self, parent=None):
@@ -151,7 +166,8 @@ class Graph(QtWidgets.QGraphicsView):
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.setResizeAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
         self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
-        self.setViewportUpdateMode(QtWidgets.QGraphicsView.FullViewportUpdate)
+        self.setViewportUpdateMode(QtWidgets.QGraphicsView.SmartViewportUpdate)
+        self.setCacheMode(QtWidgets.QGraphicsView.CacheBackground)
         self._pipe_layout = PIPE_LAYOUT_STRAIGHT
         self._live_pipe = None
         self._detached_port = None
@@ -450,6 +466,13 @@ class Graph(QtWidgets.QGraphicsView):
         super().resizeEvent(event)
         self.resized.emit()
 
+    def paintEvent(self, event):
+        # Any change of the visible area gets here before it is shown, so the
+        # deferred items are repainted right in time
+        self.scene().set_visible_rect(
+            self.mapToScene(self.viewport().rect()).boundingRect())
+        super().paintEvent(event)
+
     def get_pipe_layout(self):
         return self._pipe_layout
 
@@ -9,10 +9,15 @@ from PySide2.QtCore import Qt
 from pygears.conf import Inject, inject, reg
 from .main_window import register_prefix, message
 from .actions import shortcut, get_minibuffer_input, Interactive
+from .breakpoints import HandshakeBreakpoint, StuckBreakpoint
 from .description import describe_text, describe_trace, describe_file
 from .gtkwave import ItemNotTraced
+from .hotspots import hotspots, STATS_METRICS
+from .layout_bench import layout_benchmark
+from .timestep_bus import timestep_bus_report
+from .stall_scan import stalls
 from .node_search import node_search_completer
-from .sim_actions import time_search, step_simulator, cont_simulator
+from .sim_actions import time_search, step_simulator, cont_simulator, run_steps, clear_breakpoints
 from .timestep_modeline import TimestepModeline
 
 
@@ -283,10 +288,65 @@ def send_to_wave(
         message('Waves added: ' + ' '.join(added))
 
 
+register_prefix('graph', Qt.Key_T, 'stats')
+
+
+@shortcut('graph', (Qt.Key_T, Qt.Key_H))
+def toggle_heatmap():
+    reg['gearbox/stats/heatmap'] = not reg['gearbox/stats/heatmap']
+
+
+@shortcut('graph', (Qt.Key_T, Qt.Key_M))
+def next_heatmap_metric():
+    metric = reg['gearbox/stats/metric']
+    metric = STATS_METRICS[(STATS_METRICS.index(metric) + 1) % len(STATS_METRICS)]
+    reg['gearbox/stats/metric'] = metric
+    reg['gearbox/stats/heatmap'] = True
+    message(f'Heatmap metric: {metric}')
+
+
+shortcut('graph', (Qt.Key_T, Qt.Key_S), 'hotspots')(hotspots)
+shortcut('graph', (Qt.Key_T, Qt.Key_D), 'stalls')(stalls)
+shortcut('graph', (Qt.Key_T, Qt.Key_L), 'layout benchmark')(layout_benchmark)
+shortcut('graph', (Qt.Key_T, Qt.Key_B), 'timestep bus')(timestep_bus_report)
 shortcut('graph', Qt.Key_S)(step_simulator)
 shortcut('graph', Qt.Key_C)(cont_simulator)
 shortcut('graph', Qt.Key_Colon)(time_search)
 
+register_prefix('graph', Qt.Key_B, 'breakpoints')
+
+
+@shortcut('graph', (Qt.Key_B, Qt.Key_H))
+@single_select_action
+@inject
+def break_on_handshake(item, graph, sim_bridge=Inject('gearbox/sim_bridge')):
+    if not isinstance(item, Pipe):
+        return
+
+    sim_bridge.breakpoint(HandshakeBreakpoint(item.model.rtl))
+    message(f'Breakpoint: handshake on {item.model.name}')
+
+
+@shortcut('graph', (Qt.Key_B, Qt.Key_S))
+@single_select_action
+@inject
+def break_on_stuck(item,
+                   graph,
+                   sim_bridge=Inject('gearbox/sim_bridge'),
+                   min_cycles=Inject('gearbox/stalls/min_cycles')):
+    if isinstance(item, Pipe):
+        return
+
+    node = item.model
+    sim_bridge.breakpoint(
+        StuckBreakpoint([p.rtl for p in node.input_ext_pipes],
+                        [p.rtl for p in node.output_ext_pipes], min_cycles))
+    message(f'Breakpoint: {node.name} stuck for {min_cycles} cycles')
+
+
+shortcut('graph', (Qt.Key_B, Qt.Key_N))(run_steps)
+shortcut('graph', (Qt.Key_B, Qt.Key_X))(clear_breakpoints)
+
 
 @shortcut('graph', Qt.Key_Slash)
 @inject
@@ -3,18 +3,24 @@ import collections
 import sys
 
 from pygears import find
-from .timekeep import timestep, timestep_event_register
+from .timekeep import timestep, timestep_event_register, timestep_event_unregister
 from pygears.sim.modules import SimVerilated
 from .node_model import find_cosim_modules, PipeModel, NodeModel
-from pygears.core.hier_node import HierVisitorBase, HierYielderBase
+from pygears.core.hier_node import HierYielderBase
 from pygears.conf import Inject, MayInject, inject, reg
 from typing import NamedTuple
-from .gtkwave_intf import GtkWaveWindow
+from .gtkwave_intf import GtkWaveWindow, ShmidcatFeed
 from .layout import active_buffer, Buffer, LayoutPlugin
 from .utils import single_shot_connect
 from .dbg import dbg_connect
 from functools import partial
 from .gtkwave_vcd import PyGearsVCDMap, VerilatorVCDMap
+from .vcd_index import VCDIndex
+from .vcd_store import VCDStore, open_trace, store_path, vcd_to_store
+from .pipe_status import PipeStatusEngine, PIPE_STATUS
+from .signal_trie import signal_trie_path
+from .signal_cache import trace_signals, save_signal_cache
+from .status_batch import StatusBatch
 import os
 
 
@@ -40,10 +46,11 @@ def gtkwave_create(graph_model_ctrl=Inject('gearbox/graph_model_ctrl')):
 
 
 @inject
-def gktwave_delete(timekeep=Inject('gearbox/timekeep')):
+def gktwave_delete(timekeep=Inject('gearbox/timekeep'), sim_bridge=Inject('gearbox/sim_bridge')):
     print('Gtkwave deleted')
     gtkwave = reg['gearbox/gtkwave/inst']
-    timekeep.timestep_changed.disconnect(gtkwave.update)
+    timestep_event_unregister(gtkwave.update)
+    sim_bridge.after_cleanup.disconnect(gtkwave.sim_done)
     for b in gtkwave.buffers:
         b.delete()
 
@@ -55,11 +62,46 @@ class Signals(NamedTuple):
     valid: str
 
 
+class StoreConversion(QtCore.QObject):
+    """Converts the trace into the columnar store off the GUI thread."""
+
+    done = QtCore.Signal(str)
+
+    def __init__(self, trace_fn, store_fn):
+        super().__init__()
+        self.trace_fn = trace_fn
+        self.store_fn = store_fn
+
+        self.thrd = QtCore.QThread()
+        self.moveToThread(self.thrd)
+        reg['gearbox/main/threads'].add(self.thrd)
+        self.thrd.started.connect(self.run)
+        self.thrd.start()
+
+    def run(self):
+        try:
+            vcd_to_store(self.trace_fn, self.store_fn)
+        except (OSError, ValueError) as e:
+            print(f'Converting "{self.trace_fn}" to the waveform store failed: {e}')
+            self.done.emit('')
+        else:
+            self.done.emit(self.store_fn)
+
+        self.thrd.quit()
+
+    def finish(self):
+        # Called from the GUI thread once done was received
+        self.thrd.wait()
+        reg['gearbox/main/threads'].discard(self.thrd)
+
+
 class GtkWave:
-    def __init__(self):
+    @inject
+    def __init__(self, sim_bridge=Inject('gearbox/sim_bridge')):
         super().__init__()
 
-        timestep_event_register(self.update)
+        timestep_event_register(self.update, priority=5, cost=0.005)
+        sim_bridge.after_cleanup.connect(self.sim_done)
 
         self.graph_intfs = []
         self.instances = []
@@ -79,27 +121,86 @@ class GtkWave:
             if m.trace_fn is not None:
                 self.create_gtkwave_instance(m, VerilatorVCDMap)
 
-    def create_gtkwave_instance(self, vcd_trace_obj, vcd_map_cls):
+    @inject
+    def create_gtkwave_instance(self,
+                                vcd_trace_obj,
+                                vcd_map_cls,
+                                vcd_tail=Inject('gearbox/gtkwave/vcd_tail')):
+        vcd_index = None
+        vcd_feed = None
+
         if hasattr(vcd_trace_obj, 'shmid'):
             trace_fn = vcd_trace_obj.shmid
         else:
             trace_fn = vcd_trace_obj.trace_fn
 
+            # Pipe statuses can be read directly from the trace file, unless the
+            # trace is streamed to GtkWave via shared memory
+            if os.path.isfile(trace_fn):
+                vcd_index = open_trace(trace_fn)
+
+            # Instead of having GtkWave reload the whole file on each
+            # timestep, feed it only with the newly appended value changes
+            if vcd_tail and isinstance(vcd_index, VCDIndex):
+                vcd_feed = ShmidcatFeed()
+                with open(trace_fn, 'rb') as f:
+                    vcd_feed.write(f.read(vcd_index.offset).decode())
+
+                trace_fn = vcd_feed.shmid
+
         window = GtkWaveWindow(trace_fn)
 
+        create_buffer = partial(self.create_gtkwave_buffer, window, vcd_trace_obj, vcd_map_cls,
+                                vcd_index, vcd_feed)
+
         if window.window_id is not None:
-            self.create_gtkwave_buffer()
+            create_buffer()
         else:
             print(f'Connecting init for {vcd_trace_obj}, {vcd_map_cls}')
-            single_shot_connect(window.initialized,
-                                partial(self.create_gtkwave_buffer, window, vcd_trace_obj, vcd_map_cls))
+            single_shot_connect(window.initialized, create_buffer)
+
+    @inject
+    def create_gtkwave_buffer(self,
+                              window,
+                              vcd_trace_obj,
+                              vcd_map_cls,
+                              vcd_index,
+                              vcd_feed,
+                              signal_cache=Inject('gearbox/gtkwave/signal_cache')):
+        create_intf = partial(self.create_gtkwave_intf, window, vcd_trace_obj, vcd_map_cls,
+                              vcd_index, vcd_feed)
+
+        if isinstance(vcd_index, VCDStore) or (vcd_index is not None and vcd_index.header_done):
+            create_intf(list(vcd_index.names))
+            return
+
+        trace_fn = getattr(vcd_trace_obj, 'trace_fn', None)
+        gear = vcd_trace_obj.gear
+
+        if signal_cache and trace_fn:
+            sigs = trace_signals(trace_fn, gear)
+            if sigs is not None:
+                create_intf(sigs)
+                return
+
+        def signals_listed(ret):
+            sigs = [s.strip() for s in ret.split('\n')]
+            if signal_cache and trace_fn:
+                save_signal_cache(trace_fn, gear, sigs)
+
+            create_intf(sigs)
 
-    def create_gtkwave_buffer(self, window, vcd_trace_obj, vcd_map_cls):
+        window.command('list_signals', signals_listed)
 
-        sigs = [s.strip() for s in window.command('list_signals').split('\n')]
+    def create_gtkwave_intf(self, window, vcd_trace_obj, vcd_map_cls, vcd_index, vcd_feed, sigs):
+        # Signal index is persisted next to the trace, so that it is not
+        # rebuilt when the same design is opened again
+        trace_fn = getattr(vcd_trace_obj, 'trace_fn', None)
+        trie_fn = signal_trie_path(trace_fn) if trace_fn else None
 
-        vcd_map = vcd_map_cls(vcd_trace_obj.gear, sigs)
-        intf = GtkWaveGraphIntf(vcd_map, window)
+        vcd_map = vcd_map_cls(vcd_trace_obj.gear, sigs, trie_fn)
+
+        intf = GtkWaveGraphIntf(vcd_map, window, vcd_index, vcd_feed)
         self.graph_intfs.append(intf)
 
         buffer = GtkWaveBuffer(intf, window, f'gtkwave - {vcd_map.name}')
@@ -107,6 +208,19 @@ class GtkWave:
         self.instances.append(window)
         self.buffers.append(buffer)
 
+    @inject
+    def sim_done(self, vcd_store=Inject('gearbox/gtkwave/vcd_store')):
+        if not vcd_store:
+            return
+
+        for intf in self.graph_intfs:
+            index = intf.vcd_index
+            if index is None or isinstance(index, VCDStore):
+                continue
+
+            intf.tail_trace()
+            intf.convert_trace()
+
     def item_gtkwave_intf(self, item):
         for intf in self.graph_intfs:
             if intf.has_item_wave(item):
@@ -132,6 +246,13 @@ class GtkWave:
         for intf, pipes in intfs.items():
             intf.update_pipes(pipes)
 
+    def pipe_stats(self, start, end):
+        stats = {}
+        for intf in self.graph_intfs:
+            stats.update(intf.pipe_stats(start, end))
+
+        return stats
+
     def show_item(self, item):
         item_intf = self.item_gtkwave_intf(item)
         if item_intf is None:
@@ -164,6 +285,7 @@ class GtkWaveBuffer(Buffer):
     def delete(self):
         super().delete()
         self.gtk_window.close()
+        self.intf.close()
 
     @property
     def domain(self):
@@ -175,13 +297,13 @@ class PipeActivityVisitor(HierYielderBase):
         self.vcd_map = vcd_map
 
     def PipeModel(self, node):
-        if node.view.isVisible():
+        if node.view is not None and node.view.isVisible():
             yield node
 
         return True
 
     def NodeModel(self, node):
-        if node.view.collapsed:
+        if node.view is None or node.view.collapsed:
             return True
 
         if node not in self.vcd_map:
@@ -192,25 +314,80 @@ class PipeActivityVisitor(HierYielderBase):
         return True
 
 
-class NodeActivityVisitor(HierVisitorBase):
+class TracedPipeVisitor(HierYielderBase):
+    def __init__(self, vcd_map):
+        self.vcd_map = vcd_map
+
+    def PipeModel(self, node):
+        yield node
+        return True
+
+    def NodeModel(self, node):
+        if node not in self.vcd_map:
+            return True
+
+        yield from super().HierNode(node)
+
+        return True
+
+
+class VisibleNodeVisitor(HierYielderBase):
     def NodeModel(self, node):
+        if node.view is None:
+            return True
+
+        yield node
+
+        if node.view.collapsed:
+            return True
+
+        yield from super().HierNode(node)
+
+        return True
+
+
+def update_node_activity(nodes, batch=None):
+    for node in nodes:
         if (any(p.status == 'active' for p in node.input_ext_pipes)
                 and (not any(p.status == 'active' or p.status == 'handshaked'
                              for p in node.output_ext_pipes))):
-            node.set_status('stuck')
+            node.set_status('stuck', batch)
         else:
-            node.set_status('empty')
+            node.set_status('empty', batch)
 
-        if node.view.collapsed:
+
+def is_descendant(node, ancestor):
+    node = node.parent
+    while node is not None:
+        if node is ancestor:
             return True
 
+        node = node.parent
+
+    return False
+
+
+@inject
+def current_graph_view(graph_view=MayInject('gearbox/graph')):
+    return graph_view
+
 
 class GtkWaveGraphIntf(QtCore.QObject):
     vcd_loaded = QtCore.Signal()
 
-    def __init__(self, vcd_map, gtkwave_intf):
+    @inject
+    def __init__(self,
+                 vcd_map,
+                 gtkwave_intf,
+                 vcd_index=None,
+                 vcd_feed=None):
         super().__init__()
         self.vcd_map = vcd_map
+        self.vcd_index = vcd_index
+        self.vcd_feed = vcd_feed
+        self._status_engine = None
+        self._pipe_stats = None
+        self._conversion = None
         self.graph = vcd_map.subgraph
         self.gtkwave_intf = gtkwave_intf
         # dbg_connect(self.gtkwave_intf.response, self.gtkwave_resp)
@@ -220,9 +397,160 @@ class GtkWaveGraphIntf(QtCore.QObject):
         self.updating = False
         self.timestep = 0
 
+        self._visible_pipes = None
+        self._visible_nodes = None
+        self.graph_view = None
+
+    def connect_graph_view(self):
+        """Follows the expanding and collapsing of the nodes in the graph
+        currently registered, which might be created or replaced after this
+        interface. The visible items are collected anew for a new graph.
+        """
+
+        graph_view = current_graph_view()
+        if graph_view is self.graph_view:
+            return
+
+        self.disconnect_graph_view()
+        self._visible_pipes = None
+        self._visible_nodes = None
+
+        if graph_view is not None:
+            graph_view.node_expand_toggled.connect(self.node_expand_toggled)
+            self.graph_view = graph_view
+
+    def disconnect_graph_view(self):
+        if self.graph_view is not None:
+            try:
+                self.graph_view.node_expand_toggled.disconnect(self.node_expand_toggled)
+            except RuntimeError:
+                pass
+
+            self.graph_view = None
+
+    @property
+    def visible_pipes(self):
+        """Traced pipes that are currently shown in the graph. Kept up to date
+        as the nodes get expanded and collapsed, so that updating the statuses
+        does not need to walk the hierarchy.
+        """
+
+        self.connect_graph_view()
+
+        if self._visible_pipes is None:
+            self._visible_pipes = set(PipeActivityVisitor(self.vcd_map).visit(self.vcd_map.model))
+
+        return self._visible_pipes
+
+    @property
+    def visible_nodes(self):
+        """Nodes that are currently shown in the graph, kept up to date the
+        same way as the visible pipes."""
+
+        self.connect_graph_view()
+
+        if self._visible_nodes is None:
+            self._visible_nodes = set(VisibleNodeVisitor().visit(reg['gearbox/graph_model']))
+
+        return self._visible_nodes
+
+    def node_expand_toggled(self, expanded, node):
+        if self._visible_pipes is not None:
+            if expanded:
+                self._visible_pipes.update(PipeActivityVisitor(self.vcd_map).visit(node))
+            else:
+                self._visible_pipes.difference_update(TracedPipeVisitor(self.vcd_map).visit(node))
+
+        if self._visible_nodes is not None:
+            if expanded:
+                shown = set(VisibleNodeVisitor().visit(node)) - self._visible_nodes
+                self._visible_nodes.update(shown)
+                update_node_activity(shown)
+            else:
+                self._visible_nodes.difference_update(
+                    [n for n in self._visible_nodes if is_descendant(n, node)])
+
     def has_item_wave(self, item):
         return item in self.vcd_map
 
+    def set_trace(self, vcd_index):
+        if isinstance(self.vcd_index, VCDStore):
+            self.vcd_index.close()
+
+        self.vcd_index = vcd_index
+        self._status_engine = None
+
+    def convert_trace(self):
+        """Converts the trace into the columnar store in the background, and
+        switches to the store once it is written."""
+
+        if self._conversion is not None:
+            return
+
+        trace_fn = self.vcd_index.trace_fn
+        self._conversion = StoreConversion(trace_fn, store_path(trace_fn))
+        self._conversion.done.connect(self.trace_converted)
+
+    def trace_converted(self, store_fn):
+        self._conversion.finish()
+        self._conversion = None
+
+        # Trace might have been replaced in the meantime
+        if (store_fn and isinstance(self.vcd_index, VCDIndex)
+                and store_path(self.vcd_index.trace_fn) == store_fn):
+            self.set_trace(VCDStore(store_fn))
+
+    @property
+    def status_engine(self):
+        if self._status_engine is None:
+            pipes = []
+            sigs = []
+            for pipe in TracedPipeVisitor(self.vcd_map).visit(self.vcd_map.model):
+                try:
+                    sigs.append(self.vcd_map.pipe_handshake_signals(pipe))
+                except KeyError:
+                    continue
+
+                pipes.append(pipe)
+
+            self._status_engine = PipeStatusEngine(self.vcd_index, pipes, sigs)
+
+        return self._status_engine
+
+    def tail_trace(self):
+        if self.vcd_index is None:
+            return
+
+        data = self.vcd_index.reload()
+        if self.vcd_feed is not None:
+            self.vcd_feed.write(data)
+
+    def pipe_stats(self, start, end):
+        if self.vcd_index is None:
+            return {}
+
+        self.tail_trace()
+
+        engine = self.status_engine
+        stats = engine.stats(start * 10, end * 10)
+
+        # Heatmap and hotspots query the same stats in each timestep, which
+        # the engine returns unchanged
+        if self._pipe_stats is None or self._pipe_stats[0] is not stats:
+            self._pipe_stats = (stats, {
+                pipe: stats.pipe_stat(row)
+                for pipe, row in engine.rows.items()
+            })
+
+        return self._pipe_stats[1]
+
+    def close(self):
+        if self.vcd_feed is not None:
+            self.vcd_feed.close()
+            self.vcd_feed = None
+
+        self.disconnect_graph_view()
+
     def show_item(self, item):
         if isinstance(item, PipeModel):
             return self.show_pipe(item)
@@ -236,15 +564,17 @@ class GtkWaveGraphIntf(QtCore.QObject):
             print(f'No signals found for {node.name}')
             return
 
+        commands = []
         for i in range(0, len(sigs), 20):
             s = sigs[i:i + 20]
-            self.gtkwave_intf.command([f'gtkwave::addSignalsFromList {{{" ".join(s)}}}'])
+            commands.append(f'gtkwave::addSignalsFromList {{{" ".join(s)}}}')
 
         for i in range(0, len(sigs), 20):
             s = sigs[i:i + 20]
-            self.gtkwave_intf.command([f'gtkwave::highlightSignalsFromList {{{" ".join(s)}}}'])
+            commands.append(f'gtkwave::highlightSignalsFromList {{{" ".join(s)}}}')
 
-        self.gtkwave_intf.command([f'gtkwave::/Edit/Create_Group {node.name}'])
+        commands.append(f'gtkwave::/Edit/Create_Group {node.name}')
+        self.gtkwave_intf.command(commands)
 
         self.items_on_wave[node] = node.name
 
@@ -311,7 +641,7 @@ class GtkWaveGraphIntf(QtCore.QObject):
 
         return intf_name
 
-    def update_rtl_intf(self, pipe, wave_status):
+    def update_rtl_intf(self, pipe, wave_status, batch=None):
         if wave_status == '1 0':
             status = 'active'
         elif wave_status == '0 1':
@@ -321,7 +651,7 @@ class GtkWaveGraphIntf(QtCore.QObject):
         else:
             status = 'empty'
 
-        pipe.set_status(status)
+        pipe.set_status(status, batch)
 
     @property
     def cmd_id(self):
@@ -349,7 +679,7 @@ class GtkWaveGraphIntf(QtCore.QObject):
                 # print("Again")
                 return
 
-        self.update_pipes(PipeActivityVisitor(self.vcd_map).visit(self.vcd_map.model))
+        self.update_pipes(self.visible_pipes)
         # self.update_pipes(p for p in self.vcd_map.vcd_pipes if p.view.isVisible())
 
         if self.gtkwave_intf.shmidcat:
@@ -369,44 +699,77 @@ class GtkWaveGraphIntf(QtCore.QObject):
         # print(f'Exiting')
 
     def update_pipes(self, pipes):
+        if self.vcd_index is not None:
+            with StatusBatch() as batch:
+                self.update_pipes_from_index(pipes, batch)
+                self.update_nodes(batch)
+        else:
+            self.update_pipes_from_gtkwave(pipes)
+
+    def update_nodes(self, batch=None):
+        update_node_activity(self.visible_nodes, batch)
+
+    def update_pipes_from_index(self, pipes, batch=None):
+        self.tail_trace()
+
+        engine = self.status_engine
+        codes = engine.at(self.vcd_map.timestep * 10)
+
+        for pipe in pipes:
+            row = engine.rows.get(pipe, None)
+            if row is not None:
+                pipe.set_status(PIPE_STATUS[codes[row]], batch)
+
+    def update_pipes_from_gtkwave(self, pipes):
 
         ts = self.vcd_map.timestep
 
         signal_names = [(pipe, self.vcd_map.pipe_data_signal_stem(pipe)[:-4]) for pipe in pipes
                         if pipe.status[0] != ts]
 
-        for i in range(0, len(signal_names), 20):
-
-            cur_slice = slice(i, min(len(signal_names), i + 20))
-            cur_names = signal_names[cur_slice]
-
-            ret = self.gtkwave_intf.command(
-                f'get_values {ts*10} [list {" ".join(s[1] for s in cur_names)}]')
+        def update_slice(cur_names, ret):
+            rtl_status = ret.split('\n')
 
-            if ret is None:
+            if len(rtl_status) != len(cur_names):
                 return
 
-            rtl_status = ret.split('\n')
+            with StatusBatch() as batch:
+                for wave_status, (pipe, _) in zip(rtl_status, cur_names):
+                    self.update_rtl_intf(pipe, wave_status.strip(), batch)
 
-            if len(rtl_status) != (cur_slice.stop - cur_slice.start):
-                continue
+        # All the slices are sent to GtkWave within a single batch and their
+        # responses arrive in order, so node statuses are updated after the
+        # last one
+        fut = None
+        for i in range(0, len(signal_names), 20):
+            cur_names = signal_names[i:i + 20]
+
+            fut = self.gtkwave_intf.command(
+                f'get_values {ts*10} [list {" ".join(s[1] for s in cur_names)}]',
+                partial(update_slice, cur_names))
 
-            for wave_status, (pipe, _) in zip(rtl_status, cur_names):
-                self.update_rtl_intf(pipe, wave_status.strip())
+        def update_nodes():
+            with StatusBatch() as batch:
+                self.update_nodes(batch)
 
-        NodeActivityVisitor().visit(reg['gearbox/graph_model'])
+        if fut is None:
+            update_nodes()
+        else:
+            fut.add_done_callback(lambda f: update_nodes())
 
     @inject
     def update(self, timestep=Inject('gearbox/timestep')):
         if timestep is None:
             timestep = 0
 
+        self.tail_trace()
+
         # print(
         #     f"Updating {self.vcd_map.name} from {self.timestep} to {timestep}, id: {self.cmd_id}"
         # )
 
         if timestep < self.timestep:
-            self.update_pipes(PipeActivityVisitor(self.vcd_map).visit(self.vcd_map.model))
+            self.update_pipes(self.visible_pipes)
             # self.update_pipes(p for p in self.vcd_map.vcd_pipes if p.view.isVisible())
             self.gtkwave_intf.command(f'set_marker_if_needed {timestep*10}')
         elif not self.updating:
@@ -432,3 +795,6 @@ class GtkWaveBufferPlugin(LayoutPlugin):
                     inst.command('gtkwave::toggleStripGUI')
 
         reg.confdef('gearbox/gtkwave/menus', default=False, setter=menu_visibility)
+        reg.confdef('gearbox/gtkwave/vcd_store', default=False)
+        reg.confdef('gearbox/gtkwave/vcd_tail', default=True)
+        reg.confdef('gearbox/gtkwave/signal_cache', default=True)
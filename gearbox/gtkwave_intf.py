@@ -1,5 +1,8 @@
+import itertools
 import os
 import re
+import subprocess
+from concurrent.futures import Future
 
 import pexpect
 from PySide2 import QtCore, QtGui, QtWidgets
@@ -185,22 +188,29 @@ class GtkWaveProc(QtCore.QObject):
         # self.thrd.wait()
 
 
-class GtkWaveCmdBlock(QtCore.QEventLoop):
-    @property
-    def cmd_id(self):
-        return id(self) & 0xffff
+class ShmidcatFeed:
+    """Streams VCD text to GtkWave through a shmidcat process, so that GtkWave
+    receives only new value changes instead of reloading the whole trace.
+    """
+
+    def __init__(self):
+        self.p = subprocess.Popen(['shmidcat'],
+                                  stdin=subprocess.PIPE,
+                                  stdout=subprocess.PIPE,
+                                  universal_newlines=True)
+        self.shmid = self.p.stdout.readline().strip()
 
-    def command(self, cmd, gtk_wave):
-        self.cmd = cmd
-        gtk_wave.send_command.emit(cmd, self.cmd_id)
-        gtk_wave.proc.response.connect(self.response)
-        self.exec_()
-        return getattr(self, 'resp', None)
+    def write(self, data):
+        if not data or self.p.poll() is not None:
+            return
 
-    def response(self, resp, cmd_id):
-        if cmd_id == self.cmd_id:
-            self.resp = resp
-            self.quit()
+        self.p.stdin.write(data)
+        self.p.stdin.flush()
+
+    def close(self):
+        self.p.stdin.close()
+        self.p.terminate()
+        self.p.wait()
 
 
 native_key_map = {
@@ -245,6 +255,13 @@ class GtkWaveWindow(QtCore.QObject):
         self.proc.window_up.connect(self.window_up)
         self.send_command.connect(self.proc.command)
         self.response = self.proc.response
+        self.response.connect(self.batch_response)
+
+        # Request IDs start above the 16 bit IDs used by command_nb() callers
+        self._req_ids = itertools.count(0x10000)
+        self._queue = []
+        self._batches = {}
+        self._flush_pending = False
 
         # self.deleted.connect(self.proc.close)
         # QtWidgets.QApplication.instance().aboutToQuit.connect(self.close)
@@ -258,19 +275,61 @@ class GtkWaveWindow(QtCore.QObject):
     def command_nb(self, cmd, cmd_id=0):
         self.send_command.emit(cmd, cmd_id)
 
-    def command(self, cmd):
+    def command(self, cmd, callback=None):
+        """Queues the Tcl command and returns a Future resolved with its
+        response. All commands queued within one pass of the event loop are
+        sent to GtkWave as a single script.
+        """
+
         if isinstance(cmd, list):
             cmd = 'if {1} {\n' + '\n'.join(cmd) + '\n}'
 
-        cmd_block = GtkWaveCmdBlock()
-        # from traceback import walk_stack, print_stack
-        # stack_len = len(list(walk_stack(f=None)))
-        # print(f'Stack len: {len(list(walk_stack(f=None)))}')
-        # if stack_len > 10:
-        #     print_stack()
+        fut = Future()
+        if callback is not None:
+            fut.add_done_callback(lambda f: callback(f.result()))
+
+        self._queue.append((next(self._req_ids), cmd, fut))
+
+        if not self._flush_pending:
+            self._flush_pending = True
+            QtCore.QTimer.singleShot(0, self.flush)
+
+        return fut
+
+    def flush(self):
+        self._flush_pending = False
+        if not self._queue:
+            return
+
+        script = []
+        for req_id, cmd, _ in self._queue:
+            script.append(f'puts "@@{req_id}"')
+            script.append(f'if {{[catch {{{cmd}}} __gb_res]}} {{puts "Error: $__gb_res"}} '
+                          f'elseif {{$__gb_res ne ""}} {{puts $__gb_res}}')
+
+        batch_id = next(self._req_ids)
+        self._batches[batch_id] = {req_id: fut for req_id, _, fut in self._queue}
+        self._queue = []
+
+        self.send_command.emit('if {1} {\n' + '\n'.join(script) + '\n}', batch_id)
+
+    def batch_response(self, resp, cmd_id):
+        if cmd_id not in self._batches:
+            return
+
+        futures = self._batches.pop(cmd_id)
+        results = {req_id: [] for req_id in futures}
+
+        cur = None
+        for line in resp.split('\n'):
+            res = re.fullmatch(r"@@(\d+)", line.strip())
+            if res and int(res.group(1)) in results:
+                cur = results[int(res.group(1))]
+            elif cur is not None:
+                cur.append(line)
 
-        resp = cmd_block.command(cmd, self)
-        return resp
+        for req_id, fut in futures.items():
+            fut.set_result('\n'.join(results[req_id]))
 
     @inject
     def window_up(self, version, pid, window_id, graph=Inject('gearbox/graph')):
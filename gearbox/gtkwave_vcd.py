@@ -5,12 +5,16 @@ from pygears.conf import inject, Inject
 from pygears.core.graph import PathError
 from pygears.typing import Tuple, Union, Queue, Array, typeof
 from .timekeep import timestep
+from .signal_trie import SignalTrie, load_signal_trie
 
 
-def get_item_signals(subgraph, signals, prefix=''):
+def get_item_signals(subgraph, trie, prefix=''):
+    """Maps the signals under the prefix to the deepest items of the subgraph
+    they belong to. The trie and the item hierarchy are walked together, so
+    each distinct path element is resolved only once.
+    """
+
     item_signals = {}
-    item = subgraph
-    item_path = []
     lp = len(prefix)
 
     def find_child(parent, name):
@@ -19,58 +23,43 @@ def get_item_signals(subgraph, signals, prefix=''):
             return parent[name]
 
         # Try name as interface name
-        intf_name = p.rpartition('_')[0]
+        intf_name = name.rpartition('_')[0]
 
         if intf_name in parent:
             return parent[intf_name]
 
         return None
 
-    for name in signals:
-        if prefix and not name.startswith(prefix):
-            continue
-
-        if prefix:
-            name = name[lp:]
+    def add(item, names):
+        if names:
+            item_signals.setdefault(item, []).extend(n[lp:] for n in names)
 
-        item = subgraph
-        path = name.split('.')
+    def walk(node, item):
+        add(item, trie.own_signals(node))
 
-        new_item_path = []
-
-        import itertools
-        # for p, prev_item in itertools.zip_longest(path[1:], item_path):
-        for p, prev_item in itertools.zip_longest(path, item_path):
-            if prev_item and p == prev_item.basename:
-                item = prev_item
+        for key, child_node in trie.children(node):
+            child_item = find_child(item, key)
+            if child_item is None:
+                add(item, trie.signals(child_node))
+            elif not child_item.hierarchical:
+                add(child_item, trie.signals(child_node))
             else:
-                child_item = find_child(item, p)
-                if child_item is None:
-                    break
-
-                item = child_item
-
-            new_item_path.append(item)
-
-            if not item.hierarchical:
-                break
-
-        item_path = new_item_path
+                walk(child_node, child_item)
 
-        if item not in item_signals:
-            item_signals[item] = []
-
-        item_signals[item].append(name)
+    node = trie.find(prefix.split('.')[:-1])
+    if node is not None:
+        walk(node, subgraph)
 
     return item_signals
 
 
 class VCDMap:
-    def __init__(self, module, sigs):
+    def __init__(self, module, sigs, trie_fn=None):
         self.module = module
         self.model = reg['gearbox/graph_model_map'][module]
         self.sigs = sigs
-        self.sigmap = get_item_signals(find('/'), sigs, self.path_prefix)
+        self.trie = load_signal_trie(sigs, trie_fn)
+        self.sigmap = get_item_signals(find('/'), self.trie, self.path_prefix)
         self.item_signals = {}
 
     @property
@@ -108,7 +97,7 @@ class VCDMap:
 
 
 class VerilatorVCDMap(VCDMap):
-    def __init__(self, module, sigs):
+    def __init__(self, module, sigs, trie_fn=None):
         self.hdlgen_map = reg[f'hdlgen/map']
 
         self.hdlmod = self.hdlgen_map[module]
@@ -117,7 +106,7 @@ class VerilatorVCDMap(VCDMap):
         else:
             self.path_prefix = 'TOP.'
 
-        super().__init__(module, sigs)
+        super().__init__(module, sigs, trie_fn)
 
     def pipe_data_signal_stem(self, item):
         basename = self.item_basename(item)
@@ -140,8 +129,9 @@ class VerilatorVCDMap(VCDMap):
         return '.'.join(reversed(path))
 
     def get_pipe_groups(self, item):
-        sigs = self[item]
-        return get_type_groups(sigs, item.rtl.dtype, [self.pipe_data_signal_stem(item)])
+        # Raises KeyError for the pipes that are not traced
+        self[item]
+        return get_type_groups(self.trie, item.rtl.dtype, [self.pipe_data_signal_stem(item)])
 
     def __getitem__(self, item):
         if item not in self.item_signals:
@@ -149,13 +139,12 @@ class VerilatorVCDMap(VCDMap):
                 if not item.svintf:
                     raise KeyError
 
-                parent_node = item.rtl.parent
+                if item.rtl.parent not in self.sigmap:
+                    raise KeyError
 
-                basename = self.item_basename(item)
-                sigs = [
-                    f'{self.path_prefix}{s}' for s in self.sigmap[parent_node]
-                    if s.startswith(basename)
-                ]
+                # Signals of the child instances are mapped to them instead
+                stem = f'{self.path_prefix}{self.item_basename(item)}'
+                sigs = [s for s in self.trie.prefixed(stem) if '.' not in s[len(stem):]]
                 self.item_signals[item] = sigs
             else:
                 self.item_signals[item] = [f'{self.path_prefix}{s}' for s in self.sigmap[item.rtl]]
@@ -175,6 +164,13 @@ class VerilatorVCDMap(VCDMap):
 
 
 def get_type_groups(sigs, t, path):
+    """Groups the signals of the data of type t, whose names start with the
+    path, by the fields of the type. The whole trace trie can be passed,
+    since only the signals under the path are ever looked up."""
+
+    if not isinstance(sigs, SignalTrie):
+        sigs = SignalTrie(sigs)
+
     if typeof(t, Array):
         group = {}
         for i in range(len(t)):
@@ -186,12 +182,9 @@ def get_type_groups(sigs, t, path):
 
     if not typeof(t, (Tuple, Union, Queue)):
         name = '.'.join(path)
-        sel = []
-        for s in sigs:
-            if s.startswith(name) and (len(s) == len(name) or s[len(name)] == '['):
-                sel.append(s)
-
-        return sel
+        return [
+            s for s in sigs.prefixed(name) if len(s) == len(name) or s[len(name)] == '['
+        ]
 
     group = {}
     for name in t.fields:
@@ -201,9 +194,9 @@ def get_type_groups(sigs, t, path):
 
 
 class PyGearsVCDMap(VCDMap):
-    def __init__(self, module, sigs):
+    def __init__(self, module, sigs, trie_fn=None):
         self.path_prefix = ''
-        super().__init__(module, sigs)
+        super().__init__(module, sigs, trie_fn)
 
     def pipe_data_signal_stem(self, item):
         return self.item_basename(item) + '.data'
@@ -220,8 +213,9 @@ class PyGearsVCDMap(VCDMap):
         return item_name_stem.replace('/', '.')
 
     def get_pipe_groups(self, item):
-        sigs = self[item]
-        return get_type_groups(sigs, item.rtl.dtype, [self.item_basename(item), 'data'])
+        # Raises KeyError for the pipes that are not traced
+        self[item]
+        return get_type_groups(self.trie, item.rtl.dtype, [self.item_basename(item), 'data'])
 
     def __getitem__(self, item):
         if item.rtl in reg[f'hdlgen/map']:
@@ -235,13 +229,7 @@ class PyGearsVCDMap(VCDMap):
                 if prod_gear not in self.sigmap:
                     raise KeyError
 
-                basename = self.item_basename(item)
-                sigs = []
-                for s in self.sigmap[prod_gear]:
-                    if s.startswith(basename) and s[len(basename)] == '.':
-                        sigs.append(s)
-
-                self.item_signals[item] = sigs
+                self.item_signals[item] = self.trie.under(self.item_basename(item))
             else:
                 raise KeyError
 
@@ -1,3 +1,6 @@
+import pygraphviz as pgv
+
+
 def create_row(in_id, out_id, height, width):
     row_template = """
 <tr>
@@ -73,3 +76,27 @@ def get_node_record(node):
             iout += 1
 
     return label_template.format('\n'.join(rows))
+
+
+def graph_positions(graph):
+    """Returns the positions of the nodes and the edges of a laid out graph,
+    by their names and keys.
+    """
+
+    nodes = {str(n): n.attr['pos'] for n in graph.nodes()}
+    edges = {
+        str(key): graph.get_edge(u, v, key).attr['pos']
+        for u, v, key in graph.edges(keys=True)
+    }
+
+    return nodes, edges
+
+
+def dot_layout(source):
+    """Lays out the graph given by its DOT source. Meant to be run in the
+    worker processes of the layout pool.
+    """
+
+    graph = pgv.AGraph(string=source)
+    graph.layout(prog='dot')
+    return graph_positions(graph)
@@ -0,0 +1,172 @@
+from PySide2 import QtWidgets
+from pygears.conf import Inject, MayInject, inject, reg
+
+from .graph import GraphBufferPlugin, expand_to
+from .html_utils import tabulate, fontify
+from .layout import Buffer, show_buffer
+from .timekeep import timestep_event_register, timestep_event_unregister
+
+STATS_METRICS = ('stall_ratio', 'utilization', 'occupancy')
+
+
+@inject
+def stats_window(timestep=Inject('gearbox/timestep'), window=Inject('gearbox/stats/window')):
+    if timestep is None:
+        timestep = 0
+
+    end = timestep + 1
+    if window:
+        return max(0, end - window), end
+    else:
+        return 0, end
+
+
+@inject
+def collect_pipe_stats(gtkwave=MayInject('gearbox/gtkwave/inst')):
+    if gtkwave is None:
+        return {}
+
+    return gtkwave.pipe_stats(*stats_window())
+
+
+@inject
+def select_pipe(pipe, graph=Inject('gearbox/graph')):
+    expand_to(pipe)
+    graph.select(pipe.view)
+
+
+class PipeHeatmap:
+    """Graph buffer plugin which colors the traced pipes by the chosen metric,
+    relative to the hottest pipe in the stats window.
+    """
+
+    def __init__(self, buff):
+        self.buff = buff
+        self.pipes = set()
+        timestep_event_register(self.update, cost=0.005)
+        buff.view.node_expand_toggled.connect(self.node_expand_toggled)
+
+    @inject
+    def update(self, timestep=None, heatmap=Inject('gearbox/stats/heatmap')):
+        self.show(heatmap)
+
+    def node_expand_toggled(self, expanded, node):
+        if expanded:
+            self.update()
+
+    @inject
+    def show(self, enabled, metric=Inject('gearbox/stats/metric')):
+        if not enabled:
+            self.clear()
+            return
+
+        stats = collect_pipe_stats()
+        values = {p: getattr(s, metric) for p, s in stats.items()}
+        top = max(values.values(), default=0) or 1
+
+        # Pipes inside the nodes that were never expanded have no views yet
+        values = {p: v for p, v in values.items() if p.view is not None}
+
+        for pipe in self.pipes - values.keys():
+            pipe.view.set_heat(None)
+
+        for pipe, val in values.items():
+            pipe.view.set_heat(val / top)
+
+        self.pipes = set(values)
+
+    def clear(self):
+        for pipe in self.pipes:
+            pipe.view.set_heat(None)
+
+        self.pipes.clear()
+
+    def delete(self):
+        timestep_event_unregister(self.update)
+        try:
+            self.buff.view.node_expand_toggled.disconnect(self.node_expand_toggled)
+        except RuntimeError:
+            pass
+
+
+class Hotspots(QtWidgets.QTextBrowser):
+    def __init__(self):
+        super().__init__()
+        self.document().setDefaultStyleSheet(
+            QtWidgets.QApplication.instance().styleSheet())
+        self.setOpenLinks(False)
+        self.anchorClicked.connect(self.select)
+        self.pipes = []
+        timestep_event_register(self.update_stats, cost=0.01)
+        self.update_stats()
+
+    @inject
+    def update_stats(self, timestep=None, hotspots_num=Inject('gearbox/stats/hotspots')):
+        stats = collect_pipe_stats()
+        ranked = sorted(stats.items(), key=lambda s: (s[1].stalls, s[1].occupancy), reverse=True)
+        ranked = ranked[:hotspots_num]
+        self.pipes = [p for p, _ in ranked]
+
+        start, end = stats_window()
+        header = ['Pipe', 'Stalls', 'Stall %', 'Util %', 'Occup %', 'Handshakes']
+        table = [[('', fontify(h, bold=True)) for h in header]]
+        for i, (pipe, s) in enumerate(ranked):
+            table.append([
+                ('', f'<a href="pipe:{i}">{pipe.name}</a>'),
+                ('align="right"', s.stalls),
+                ('align="right"', f'{s.stall_ratio*100:.1f}'),
+                ('align="right"', f'{s.utilization*100:.1f}'),
+                ('align="right"', f'{s.occupancy*100:.1f}'),
+                ('align="right"', s.handshakes),
+            ])
+
+        self.setHtml(
+            fontify(f'Hotspots in timesteps [{start}, {end})', bold=True) +
+            tabulate(table, 'cellpadding="4"'))
+
+    def select(self, url):
+        if url.scheme() == 'pipe':
+            select_pipe(self.pipes[int(url.path())])
+
+    def delete(self):
+        timestep_event_unregister(self.update_stats)
+
+
+class HotspotsBuffer(Buffer):
+    def delete(self):
+        super().delete()
+        self.view.delete()
+
+    @property
+    def domain(self):
+        return 'hotspots'
+
+
+@inject
+def hotspots(layout=Inject('gearbox/layout')):
+    for b in layout.buffers:
+        if isinstance(b, HotspotsBuffer):
+            b.view.update_stats()
+            break
+    else:
+        b = HotspotsBuffer(Hotspots(), 'hotspots')
+
+    show_buffer(b)
+    return b
+
+
+class HeatmapPlugin(GraphBufferPlugin):
+    @classmethod
+    def bind(cls):
+        reg['gearbox/plugins/graph']['PipeHeatmap'] = PipeHeatmap
+
+        @inject
+        def heatmap_visibility(var, visible, ctrl=MayInject('gearbox/graph_model_ctrl')):
+            buff = getattr(ctrl, 'buff', None)
+            if buff is not None:
+                buff.plugins['PipeHeatmap'].show(visible)
+
+        reg.confdef('gearbox/stats/heatmap', default=False, setter=heatmap_visibility)
+        reg.confdef('gearbox/stats/window', default=0)
+        reg.confdef('gearbox/stats/metric', default='stall_ratio')
+        reg.confdef('gearbox/stats/hotspots', default=50)
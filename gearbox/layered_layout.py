@@ -0,0 +1,353 @@
+from typing import NamedTuple
+
+import numpy as np
+
+RANKSEP = 40
+NODESEP = 20
+DUMMYSEP = 6
+SWEEPS = 8
+PLACEMENT_PASSES = 4
+
+
+class LayeredGraph(NamedTuple):
+    """Input of the layered layout engine. Child nodes are referred to by
+    their indices, and the ports of the laid out node by 'iK' and 'oK', the
+    same as in the edges of the layout cache descriptions. Port offsets are
+    measured from the top of each node.
+    """
+
+    sizes: tuple
+    in_ports: tuple
+    out_ports: tuple
+    num_inputs: int
+    num_outputs: int
+    edges: tuple
+
+
+def _break_cycles(num, succ, roots):
+    """Returns the set of edges (by their index) reversed to make the graph
+    acyclic, found as the back edges of a depth first search.
+    """
+
+    reversed_edges = set()
+    state = np.zeros(num, dtype=np.int8)
+    for root in list(roots) + list(range(num)):
+        if state[root]:
+            continue
+
+        state[root] = 1
+        stack = [(root, iter(succ[root]))]
+        while stack:
+            v, it = stack[-1]
+            for e, w in it:
+                if state[w] == 1:
+                    reversed_edges.add(e)
+                elif state[w] == 0:
+                    state[w] = 1
+                    stack.append((w, iter(succ[w])))
+                    break
+            else:
+                state[v] = 2
+                stack.pop()
+
+    return reversed_edges
+
+
+def _topo_order(num, dag):
+    indeg = np.zeros(num, dtype=np.int64)
+    succ = [[] for _ in range(num)]
+    for u, v in dag:
+        succ[u].append(v)
+        indeg[v] += 1
+
+    order = list(np.nonzero(indeg == 0)[0])
+    for v in order:
+        for w in succ[v]:
+            indeg[w] -= 1
+            if indeg[w] == 0:
+                order.append(w)
+
+    return order, succ
+
+
+def _count_crossings(a, b):
+    if len(a) < 2:
+        return 0
+
+    da = a[:, None] - a[None, :]
+    db = b[:, None] - b[None, :]
+    return int(np.count_nonzero(da * db < 0)) // 2
+
+
+class _Layering:
+    def __init__(self, graph):
+        n = len(graph.sizes)
+        ni, no = graph.num_inputs, graph.num_outputs
+        self.n, self.ni, self.no = n, ni, no
+        num = n + ni + no
+
+        def vertex(v, side):
+            if isinstance(v, str):
+                k = int(v[1:])
+                return n + k if side == 'i' else n + ni + k
+
+            return v
+
+        self.edges = [(vertex(s, 'i'), sp, vertex(d, 'o'), dp) for s, sp, d, dp in graph.edges]
+
+        succ = [[] for _ in range(num)]
+        for e, (u, _, v, _) in enumerate(self.edges):
+            succ[u].append((e, v))
+
+        self.reversed = _break_cycles(num, succ, range(n, n + ni))
+        dag = [(v, u) if e in self.reversed else (u, v) for e, (u, _, v, _) in enumerate(self.edges)]
+
+        order, dag_succ = _topo_order(num, dag)
+
+        # Ports of the laid out node take the first and the last layer
+        layer = np.ones(num, dtype=np.int64)
+        layer[n:n + ni] = 0
+        for v in order:
+            if v >= n + ni:
+                continue
+
+            for w in dag_succ[v]:
+                layer[w] = max(layer[w], layer[v] + 1)
+
+        last = int(layer[:n].max()) + 1 if n else 1
+        layer[n + ni:] = last
+        self.num_layers = last + 1
+
+        self.width = np.zeros(num)
+        self.height = np.zeros(num)
+        self.width[:n] = [s[0] for s in graph.sizes]
+        self.height[:n] = [s[1] for s in graph.sizes]
+
+        self.layer = list(layer)
+        self.dag = dag
+        self.chains = [self.add_chain(u, v) for u, v in dag]
+
+        # Port offsets of the segment ends, measured from the top of the vertex
+        self.seg_a, self.seg_b, self.seg_aoff, self.seg_boff = [], [], [], []
+        for e, chain in enumerate(self.chains):
+            u, up, v, vp = self.edges[e]
+            uoff = self.port_offset(graph, u, up, 'out')
+            voff = self.port_offset(graph, v, vp, 'in')
+            if e in self.reversed:
+                uoff, voff = voff, uoff
+
+            offs = [uoff] + [0] * (len(chain) - 2) + [voff]
+            for i in range(len(chain) - 1):
+                self.seg_a.append(chain[i])
+                self.seg_b.append(chain[i + 1])
+                self.seg_aoff.append(offs[i])
+                self.seg_boff.append(offs[i + 1])
+
+        self.seg_a = np.array(self.seg_a, dtype=np.int64)
+        self.seg_b = np.array(self.seg_b, dtype=np.int64)
+        self.seg_aoff = np.array(self.seg_aoff, dtype=float)
+        self.seg_boff = np.array(self.seg_boff, dtype=float)
+
+        self.layer = np.array(self.layer, dtype=np.int64)
+        self.num = len(self.layer)
+        self.width = np.concatenate([self.width, np.zeros(self.num - num)])
+        self.height = np.concatenate([self.height, np.zeros(self.num - num)])
+
+    def add_chain(self, u, v):
+        chain = [u]
+        for lay in range(self.layer[u] + 1, self.layer[v]):
+            self.layer.append(lay)
+            chain.append(len(self.layer) - 1)
+
+        chain.append(v)
+        return chain
+
+    def port_offset(self, graph, v, port, side):
+        if v >= self.n:
+            return 0
+
+        offsets = graph.out_ports[v] if side == 'out' else graph.in_ports[v]
+        if port < len(offsets):
+            return offsets[port]
+
+        return graph.sizes[v][1] / 2
+
+    def layers(self):
+        return [list(np.nonzero(self.layer == lay)[0]) for lay in range(self.num_layers)]
+
+
+def _order(lay, layers):
+    """Orders the vertices within the layers by sweeping the barycenters of
+    their port positions down and up the layers, and keeps the ordering with
+    the fewest crossings.
+    """
+
+    pos = np.zeros(lay.num)
+    for vs in layers:
+        pos[vs] = np.arange(len(vs))
+
+    # Ports are placed at fractional positions along the height of a vertex
+    height = np.where(lay.height > 0, lay.height, 1)
+    afrac = lay.seg_aoff / height[lay.seg_a]
+    bfrac = lay.seg_boff / height[lay.seg_b]
+
+    seg_layer = lay.layer[lay.seg_a]
+
+    def crossings():
+        total = 0
+        for i in range(lay.num_layers - 1):
+            mask = seg_layer == i
+            total += _count_crossings(pos[lay.seg_a[mask]] + afrac[mask],
+                                      pos[lay.seg_b[mask]] + bfrac[mask])
+        return total
+
+    def sweep(i, down):
+        if down:
+            mask = seg_layer == i - 1
+            v, nb, frac = lay.seg_b[mask], lay.seg_a[mask], afrac[mask]
+        else:
+            mask = seg_layer == i
+            v, nb, frac = lay.seg_a[mask], lay.seg_b[mask], bfrac[mask]
+
+        sums = np.bincount(v, weights=pos[nb] + frac, minlength=lay.num)
+        counts = np.bincount(v, minlength=lay.num)
+
+        vs = np.array(layers[i], dtype=np.int64)
+        bary = np.where(counts[vs] > 0, sums[vs] / np.maximum(counts[vs], 1), pos[vs])
+        vs = vs[np.lexsort((pos[vs], bary))]
+        layers[i] = list(vs)
+        pos[vs] = np.arange(len(vs))
+
+    best = crossings()
+    best_layers = [list(vs) for vs in layers]
+
+    # The first and the last layer hold the ports, which keep their order
+    inner = range(1, lay.num_layers - 1)
+    for s in range(SWEEPS):
+        down = (s % 2 == 0)
+        for i in (inner if down else reversed(inner)):
+            sweep(i, down)
+
+        cur = crossings()
+        if cur < best:
+            best = cur
+            best_layers = [list(vs) for vs in layers]
+
+        if best == 0:
+            break
+
+    return best_layers
+
+
+def _place(lay, layers):
+    """Assigns the vertical positions of the vertex tops within the layers,
+    aligning the ports on both ends of the segments where the ordering and
+    the separation allow it.
+    """
+
+    sep = np.where(lay.height > 0, NODESEP, DUMMYSEP)
+    top = np.zeros(lay.num)
+    for vs in layers:
+        y = 0
+        for v in vs:
+            top[v] = y
+            y += lay.height[v] + sep[v]
+
+    def fit(vs, desired):
+        # Both the downwards and the upwards packing keep the order and the
+        # separation, and so does their average
+        h = lay.height[vs] + sep[vs]
+        down = desired.copy()
+        for i in range(1, len(vs)):
+            down[i] = max(down[i], down[i - 1] + h[i - 1])
+
+        up = desired.copy()
+        for i in range(len(vs) - 2, -1, -1):
+            up[i] = min(up[i], up[i + 1] - h[i])
+
+        return (down + up) / 2
+
+    for p in range(PLACEMENT_PASSES * 2):
+        down = (p % 2 == 0)
+        order = range(1, lay.num_layers) if down else range(lay.num_layers - 2, -1, -1)
+        for i in order:
+            if down:
+                mask = lay.layer[lay.seg_b] == i
+                v, nb = lay.seg_b[mask], lay.seg_a[mask]
+                own, other = lay.seg_boff[mask], lay.seg_aoff[mask]
+            else:
+                mask = lay.layer[lay.seg_a] == i
+                v, nb = lay.seg_a[mask], lay.seg_b[mask]
+                own, other = lay.seg_aoff[mask], lay.seg_boff[mask]
+
+            sums = np.bincount(v, weights=top[nb] + other - own, minlength=lay.num)
+            counts = np.bincount(v, minlength=lay.num)
+
+            vs = np.array(layers[i], dtype=np.int64)
+            if not len(vs):
+                continue
+
+            desired = np.where(counts[vs] > 0, sums[vs] / np.maximum(counts[vs], 1), top[vs])
+            top[vs] = fit(vs, desired)
+
+    return top - top.min()
+
+
+def layered_layout(graph):
+    """Lays out the graph in layers from left to right, in the manner of
+    Sugiyama et al.: cycles are broken, vertices are assigned to layers by
+    the longest path, long edges are split by dummy vertices, the layers are
+    ordered by the barycenter heuristic on the port positions, and the edges
+    are routed through the dummy vertices as cubic splines.
+
+    Returns the result in the same form as the one computed from the graphviz
+    layout: the node centers and the port positions with the y axis pointing
+    up, and the spline control points of the edges.
+    """
+
+    lay = _Layering(graph)
+    layers = _order(lay, lay.layers())
+    top = _place(lay, layers)
+
+    layer_width = np.zeros(lay.num_layers)
+    np.maximum.at(layer_width, lay.layer, lay.width)
+    layer_left = np.concatenate([[0], np.cumsum(layer_width + RANKSEP)[:-1]])
+    cx = layer_left[lay.layer] + layer_width[lay.layer] / 2
+
+    def point(v, off, side):
+        x = cx[v]
+        if side == 'out':
+            x += lay.width[v] / 2
+        elif side == 'in':
+            x -= lay.width[v] / 2
+
+        return (float(x), float(-(top[v] + off)))
+
+    pipes = []
+    for e, chain in enumerate(lay.chains):
+        u, up, v, vp = lay.edges[e]
+        uoff = lay.port_offset(graph, u, up, 'out')
+        voff = lay.port_offset(graph, v, vp, 'in')
+
+        inner = [point(d, 0, None) for d in chain[1:-1]]
+        if e in lay.reversed:
+            inner.reverse()
+
+        points = [point(u, uoff, 'out')] + inner + [point(v, voff, 'in')]
+
+        path = [points[-1], points[0]]
+        for a, b in zip(points, points[1:]):
+            dx = max(abs(b[0] - a[0]) / 2, RANKSEP / 3)
+            path.extend([(a[0] + dx, a[1]), (b[0] - dx, b[1]), b])
+
+        pipes.append(path)
+
+    n, ni = lay.n, lay.ni
+    centers = [(float(cx[v]), float(-(top[v] + lay.height[v] / 2))) for v in range(lay.num)]
+
+    return {
+        'nodes': centers[:n],
+        'inputs': centers[n:n + ni],
+        'outputs': centers[n + ni:n + ni + lay.no],
+        'pipes': pipes,
+    }
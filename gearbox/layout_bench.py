@@ -0,0 +1,51 @@
+import time
+
+from pygears.conf import Inject, inject
+
+from .description import describe_text
+from .html_utils import tabulate, fontify
+from .layout_sched import expanded_levels
+from .node import build_layout_graph, compute_layout
+
+LAYOUT_ENGINES = ('dot', 'layered')
+
+
+def time_layout(node, engine, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build_layout_graph(node, engine=engine)
+        compute_layout(node, engine=engine)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+@inject
+def layout_benchmark(graph=Inject('gearbox/graph')):
+    """Times each layout engine on the graphs of all the expanded nodes, as
+    they are currently sized, bypassing the layout cache.
+    """
+
+    header = ['Node', 'Nodes', 'Pipes'] + [f'{e} [ms]' for e in LAYOUT_ENGINES]
+    table = [[('', fontify(h, bold=True)) for h in header]]
+    totals = dict.fromkeys(LAYOUT_ENGINES, 0)
+
+    for level in reversed(expanded_levels(graph.top)):
+        for node in level:
+            row = [('', node.model.name or '/'), ('align="right"', len(node._nodes)),
+                   ('align="right"', len(node.pipes))]
+
+            for engine in LAYOUT_ENGINES:
+                elapsed = time_layout(node, engine)
+                totals[engine] += elapsed
+                row.append(('align="right"', f'{elapsed*1000:.1f}'))
+
+            table.append(row)
+
+    table.append([('', fontify('Total', bold=True)), ('', ''), ('', '')] +
+                 [('align="right"', fontify(f'{totals[e]*1000:.1f}', bold=True))
+                  for e in LAYOUT_ENGINES])
+
+    describe_text(fontify('Layout engine benchmark', bold=True) + tabulate(table, 'cellpadding="4"'))
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+
+from pygears.conf import Inject, MayInject, inject, reg
+
+from .layout import LayoutPlugin
+
+LAYOUT_CACHE_VERSION = 1
+LAYOUT_CACHE_DIR = '.gearbox_layouts'
+
+
+def layout_key(desc):
+    """Hashes the canonical description of the subgraph, which lists the
+    graphviz labels of the child nodes, the number of ports and the edges,
+    with the nodes and ports referred to by their indices.
+    """
+
+    h = hashlib.sha1(repr((LAYOUT_CACHE_VERSION, desc)).encode())
+    return h.hexdigest()
+
+
+class LayoutCache:
+    """Layout results of the hierarchical nodes, kept in memory with LRU
+    eviction and persisted as one file per subgraph under the results
+    directory.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+
+    @inject
+    def cache_dir(self, outdir=MayInject('results-dir')):
+        if outdir is None:
+            return None
+
+        return os.path.join(outdir, LAYOUT_CACHE_DIR)
+
+    def load(self, key):
+        cache_dir = self.cache_dir()
+        if cache_dir is None:
+            return None
+
+        try:
+            with open(os.path.join(cache_dir, key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+            return None
+
+    def save(self, key, res):
+        cache_dir = self.cache_dir()
+        if cache_dir is None:
+            return
+
+        fn = os.path.join(cache_dir, key)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(fn + '.tmp', 'wb') as f:
+                pickle.dump(res, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+            os.replace(fn + '.tmp', fn)
+        except OSError:
+            pass
+
+    def get(self, key):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        res = self.load(key)
+        if res is not None:
+            self.put(key, res, persist=False)
+
+        return res
+
+    @inject
+    def put(self, key, res, persist=True, size=Inject('gearbox/graph_layout/cache_size')):
+        self.entries[key] = res
+        self.entries.move_to_end(key)
+        while len(self.entries) > size:
+            self.entries.popitem(last=False)
+
+        if persist:
+            self.save(key, res)
+
+    def clear(self):
+        self.entries.clear()
+
+
+@inject
+def lookup_layout(desc, enabled=Inject('gearbox/graph_layout/cache')):
+    """Returns the cache key for the subgraph described by desc and its
+    layout result, if it was laid out before. The key is None if the cache
+    is disabled.
+    """
+
+    if not enabled:
+        return None, None
+
+    key = layout_key(desc)
+    return key, reg['gearbox/graph_layout/cache_inst'].get(key)
+
+
+def store_layout(key, res):
+    if key is not None:
+        reg['gearbox/graph_layout/cache_inst'].put(key, res)
+
+
+def cached_layout(desc, compute):
+    """Returns the layout result for the subgraph described by desc, calling
+    compute() only if it was not laid out before.
+    """
+
+    key, res = lookup_layout(desc)
+    if res is None:
+        res = compute()
+        store_layout(key, res)
+
+    return res
+
+
+class LayoutCachePlugin(LayoutPlugin):
+    @classmethod
+    def bind(cls):
+        reg['gearbox/graph_layout/cache_inst'] = LayoutCache()
+        reg.confdef('gearbox/graph_layout/cache', default=True)
+        reg.confdef('gearbox/graph_layout/cache_size', default=1024)
@@ -0,0 +1,81 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PySide2 import QtWidgets
+from pygears.conf import Inject, inject, reg
+
+from .gv_utils import dot_layout
+from .layout import LayoutPlugin
+
+
+class LayoutPool:
+    """Pool of worker processes running graphviz on the DOT sources of the
+    hierarchical nodes, so that the independent subgraphs can be laid out in
+    parallel.
+    """
+
+    def __init__(self):
+        self.executor = None
+        self.jobs = 0
+        self.quit_connected = False
+
+    @inject
+    def workers(self, jobs=Inject('gearbox/graph_layout/jobs')):
+        if not jobs:
+            jobs = os.cpu_count() or 1
+
+        return jobs
+
+    def map(self, sources, background=False):
+        """Lays out the graphs given by their DOT sources, and returns their
+        node and edge positions in the same order.
+
+        In the background, the graphs are always laid out by the pool, even
+        a single one, since graphviz holds the GIL for the whole layout and
+        would freeze the GUI. Otherwise they are laid out in-process if there
+        is nothing to parallelize.
+        """
+
+        workers = self.workers()
+        if not background and (workers < 2 or len(sources) < 2):
+            return [dot_layout(s) for s in sources]
+
+        executor = self.executor_for(workers)
+        if executor is None:
+            return [dot_layout(s) for s in sources]
+
+        return list(executor.map(dot_layout, sources))
+
+    def executor_for(self, workers):
+        if self.executor is None or self.jobs != workers:
+            self.shutdown()
+            # Pool is started from the layout thread, and forking a process
+            # with running Qt threads could leave the workers with locks held
+            # by the threads that were not forked
+            try:
+                self.executor = ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context('forkserver'))
+            except (ValueError, OSError):
+                return None
+
+            self.jobs = workers
+
+            app = QtWidgets.QApplication.instance()
+            if app is not None and not self.quit_connected:
+                app.aboutToQuit.connect(self.shutdown)
+                self.quit_connected = True
+
+        return self.executor
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+
+class LayoutPoolPlugin(LayoutPlugin):
+    @classmethod
+    def bind(cls):
+        reg['gearbox/graph_layout/pool'] = LayoutPool()
+        reg.confdef('gearbox/graph_layout/jobs', default=0)
@@ -0,0 +1,273 @@
+from PySide2 import QtCore, QtWidgets
+from pygears.conf import Inject, inject, reg
+
+from .layout import LayoutPlugin
+from .layout_cache import lookup_layout, store_layout
+from .node import apply_layout, build_layout_graph, compute_layout, layout_result
+
+
+def expanded_levels(top):
+    """Returns the expanded nodes of the hierarchy, grouped by depth"""
+
+    levels = []
+    level = [top]
+    while level:
+        levels.append(level)
+        level = [
+            node for parent in level for node in parent._nodes
+            if not getattr(node, 'collapsed', True)
+        ]
+
+    return levels
+
+
+def prepare_level(level):
+    """Lays out the collapsed children of the nodes on the level, and looks
+    their graphs up in the layout cache. Returns the cached results and the
+    nodes that still need to be laid out, with their cache keys.
+    """
+
+    results = {}
+    pending = []
+    for node in level:
+        for child in node._nodes:
+            if getattr(child, 'collapsed', True) and hasattr(child, 'layout'):
+                child.layout()
+
+        desc = build_layout_graph(node)
+        key, res = lookup_layout(desc)
+        if res is None and desc[0] == 'layered':
+            # Built-in engine is cheaper than shipping the graph to the pool
+            res = compute_layout(node)
+            store_layout(key, res)
+
+        if res is None:
+            pending.append((node, key))
+        else:
+            results[node] = res
+
+    return results, pending
+
+
+def finish_level(level, results, pending, positions):
+    for (node, key), pos in zip(pending, positions):
+        results[node] = layout_result(node, *pos)
+        store_layout(key, results[node])
+
+    for node in level:
+        apply_layout(node, results[node])
+
+
+class LayoutWorker(QtCore.QObject):
+    """Runs graphviz on the DOT sources of a level off the GUI thread"""
+
+    request = QtCore.Signal(object, object)
+    done = QtCore.Signal(object, object)
+
+    @inject
+    def __init__(self, pool=Inject('gearbox/graph_layout/pool')):
+        super().__init__()
+        self.pool = pool
+
+        self.thrd = QtCore.QThread()
+        self.moveToThread(self.thrd)
+        reg['gearbox/main/threads'].add(self.thrd)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.thrd.quit)
+        self.request.connect(self.run)
+        self.thrd.start()
+
+    def run(self, task, sources):
+        self.done.emit(task, self.pool.map(sources, background=True))
+
+
+class LayoutTask(QtCore.QObject):
+    """Lays out the hierarchy bottom-up, level by level, like layout_tree(),
+    but graphviz runs in the layout worker, while the GUI thread only applies
+    the positions. Each level is shown as soon as it is laid out.
+    """
+
+    def __init__(self, top, worker):
+        super().__init__()
+        self.top = top
+        self.worker = worker
+        self.levels = expanded_levels(top)
+        self.level = None
+        self.cancelled = False
+        self.waiting = False
+        worker.done.connect(self.level_done)
+
+    def start(self):
+        if self.cancelled:
+            return
+
+        self.top.graph.scene().begin_bulk_move()
+
+        while self.levels:
+            self.level = self.levels.pop()
+            self.results, self.pending = prepare_level(self.level)
+            if self.pending:
+                self.waiting = True
+                self.worker.request.emit(self, [n.layout_graph.string() for n, _ in self.pending])
+                return
+
+            finish_level(self.level, self.results, [], [])
+
+        self.finish()
+
+    def level_done(self, task, positions):
+        if task is not self:
+            return
+
+        self.waiting = False
+        if self.cancelled:
+            # Results are keyed by the graph contents, so they are still
+            # worth keeping even though they will not be applied
+            for (node, key), pos in zip(self.pending, positions):
+                store_layout(key, layout_result(node, *pos))
+
+            self.worker.done.disconnect(self.level_done)
+            return
+
+        finish_level(self.level, self.results, self.pending, positions)
+
+        # Let the GUI process the events before going on with the next level
+        QtCore.QTimer.singleShot(0, self.start)
+
+    def finish(self):
+        self.top.graph.scene().end_bulk_move()
+        self.worker.done.disconnect(self.level_done)
+        self.top.layout_task = None
+        self.top.graph.layout_finished.emit()
+
+    def cancel(self):
+        self.cancelled = True
+        self.top.graph.scene().end_bulk_move()
+        if not self.waiting:
+            self.worker.done.disconnect(self.level_done)
+
+
+@inject
+def layout_worker(worker=Inject('gearbox/graph_layout/worker')):
+    if worker is None:
+        worker = LayoutWorker()
+        reg['gearbox/graph_layout/worker'] = worker
+
+    return worker
+
+
+@inject
+def layout_tree(top,
+                pool=Inject('gearbox/graph_layout/pool'),
+                background=Inject('gearbox/graph_layout/background')):
+    """Lays out the whole hierarchy bottom-up, level by level. Children of the
+    nodes on the same level are laid out by then, so the graphviz graphs of
+    the level are independent and the ones not found in the layout cache are
+    laid out in parallel by the layout pool.
+    """
+
+    cancel_layout(top)
+
+    if background:
+        top.layout_task = LayoutTask(top, layout_worker())
+        top.layout_task.start()
+        return
+
+    scene = top.graph.scene()
+    scene.begin_bulk_move()
+    for level in reversed(expanded_levels(top)):
+        results, pending = prepare_level(level)
+        positions = pool.map([node.layout_graph.string() for node, _ in pending])
+        finish_level(level, results, pending, positions)
+
+    scene.end_bulk_move()
+    top.graph.layout_finished.emit()
+
+
+def cancel_layout(top):
+    if top.layout_task is not None:
+        top.layout_task.cancel()
+        top.layout_task = None
+
+
+def shift_layout(parent, child):
+    """Adapts the previous layout of the parent to the new size of one of its
+    children, without running graphviz. Ranks and ordering are kept: the
+    child grows to the right and downwards from its top left corner, the
+    items to its right are shifted by the change in width, and the ones below
+    it in its column by the change in height.
+    """
+
+    res = parent.layout_res
+    i = parent._nodes.index(child)
+    width, height = parent.layout_sizes[i]
+    dw = child.width - width
+    dh = child.height - height
+
+    x, y = res['nodes'][i]
+    left, right = x - width / 2, x + width / 2
+    bottom = y - height / 2
+
+    def shift_point(pos, w=0, h=0):
+        px, py = pos
+        if px - w / 2 >= right:
+            return (px + dw, py)
+
+        if px + w / 2 > left and px - w / 2 < right and py + h / 2 <= bottom:
+            return (px, py - dh)
+
+        return pos
+
+    nodes = []
+    for j, (node, pos) in enumerate(zip(parent._nodes, res['nodes'])):
+        if j == i:
+            nodes.append((x + dw / 2, y - dh / 2))
+        else:
+            nodes.append(shift_point(pos, *parent.layout_sizes[j]))
+
+    return {
+        'nodes': nodes,
+        'inputs': [shift_point(p) for p in res['inputs']],
+        'outputs': [shift_point(p) for p in res['outputs']],
+        'pipes': [[shift_point(p) for p in path] for path in res['pipes']],
+    }
+
+
+@inject
+def relayout(node, incremental=Inject('gearbox/graph_layout/incremental')):
+    """Updates the layout after the node was expanded or collapsed. In the
+    incremental mode only the node itself is laid out anew, and the layouts
+    of its ancestors are shifted to make room for its new size.
+    """
+
+    top = node.graph.top
+    if not incremental or top.layout_task is not None:
+        top.layout()
+        return
+
+    path = []
+    parent = node.parent
+    while parent is not None:
+        if parent.layout_res is None:
+            top.layout()
+            return
+
+        path.append(parent)
+        parent = parent.parent
+
+    node.layout()
+
+    child = node
+    for parent in path:
+        apply_layout(parent, shift_layout(parent, child))
+        child = parent
+
+    top.graph.layout_finished.emit()
+
+
+class LayoutSchedPlugin(LayoutPlugin):
+    @classmethod
+    def bind(cls):
+        reg['gearbox/graph_layout/worker'] = None
+        reg.confdef('gearbox/graph_layout/background', default=True)
+        reg.confdef('gearbox/graph_layout/incremental', default=False)
+        reg.confdef('gearbox/graph_layout/engine', default='dot')
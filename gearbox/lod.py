@@ -0,0 +1,42 @@
+from PySide2 import QtWidgets
+from pygears.conf import reg
+
+from .layout import LayoutPlugin
+
+# Levels of detail (scale of the item on screen) below which the graph is
+# drawn simplified: nodes as plain rectangles without ports and text, and
+# further below, pipes as polylines
+LOD_THRESHOLDS = {'detail': 0.5, 'outline': 0.2}
+
+
+def level_of_detail(painter, option):
+    return option.levelOfDetailFromTransform(painter.worldTransform())
+
+
+def lod_detailed(painter, option):
+    return level_of_detail(painter, option) >= LOD_THRESHOLDS['detail']
+
+
+class LodTextItem(QtWidgets.QGraphicsTextItem):
+    """Text item which is not drawn when zoomed out below the detail level"""
+
+    def paint(self, painter, option, widget):
+        if lod_detailed(painter, option):
+            super().paint(painter, option, widget)
+
+
+class LodPlugin(LayoutPlugin):
+    @classmethod
+    def bind(cls):
+        def detail_threshold(var, value):
+            LOD_THRESHOLDS['detail'] = value
+
+        def outline_threshold(var, value):
+            LOD_THRESHOLDS['outline'] = value
+
+        reg.confdef('gearbox/graph_lod/detail',
+                    default=LOD_THRESHOLDS['detail'],
+                    setter=detail_threshold)
+        reg.confdef('gearbox/graph_lod/outline',
+                    default=LOD_THRESHOLDS['outline'],
+                    setter=outline_threshold)
@@ -16,7 +16,7 @@ from pygears.conf.custom_settings import load_rc
 from pygears.sim.extens.vcd import SimVCDPlugin
 
 from . import (actions, buffer_actions, description_actions, file_actions, graph_actions,
-               gtkwave_actions, toggle_actions, window_actions)
+               gtkwave_actions, layout_pool, toggle_actions, window_actions)
 from .compilation import compilation
 from .pygears_proxy import sim_bridge
 # import gearbox.graph
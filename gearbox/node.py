@@ -1,15 +1,19 @@
 import pygraphviz as pgv
-from PySide2 import QtCore, QtGui, QtWidgets
+from PySide2 import QtCore, QtGui
 
 from pygears.conf import Inject, inject
 from pygears.core.port import InPort
 
 from . import gv_utils
 from .constants import NODE_SEL_BORDER_COLOR, NODE_SEL_COLOR, Z_VAL_NODE
+from .layered_layout import LayeredGraph, layered_layout
+from .layout_cache import cached_layout
+from .lod import LodTextItem, lod_detailed
 from .node_abstract import AbstractNodeItem
 from .pipe import Pipe
 from .port import PortItem
 from .theme import themify
+from .utils import single_shot_connect
 
 NODE_SIM_STATUS_COLOR = {
     'empty_hier': '#303a45',
@@ -59,15 +63,73 @@ def minimized_layout(self):
         text.hide()
 
 
+def gv_point_load(point):
+    return tuple(float(num) for num in point.split(',')[-2:])
+
+
 def hier_layout(self):
     if self.collapsed:
         node_layout(self)
         return
 
+    if self.parent is None:
+        from .layout_sched import layout_tree
+        layout_tree(self)
+        return
+
     for node in self._nodes:
         if hasattr(node, 'layout'):
             node.layout()
 
+    desc = build_layout_graph(self)
+    res = cached_layout(desc, lambda: compute_layout(self))
+    apply_layout(self, res)
+
+
+def layout_edges(self):
+    node_ids = {id(node): i for i, node in enumerate(self._nodes)}
+
+    def vertex(port, side):
+        if port.node is self:
+            return f'{side}{port.model.index}'
+
+        return node_ids[id(port.node)]
+
+    return tuple((vertex(p.output_port, 'i'), p.output_port.model.index,
+                  vertex(p.input_port, 'o'), p.input_port.model.index)
+                 for p in self.pipes)
+
+
+def layered_graph(self):
+    """Returns the input of the layered layout engine for the node"""
+
+    def port_offsets(node, ports):
+        if node._layout == minimized_layout:
+            return tuple(node.height / 2 for _ in ports)
+
+        return tuple(p.y() + p._height / 2 for p in ports)
+
+    return LayeredGraph(
+        sizes=tuple((node.width, node.height) for node in self._nodes),
+        in_ports=tuple(port_offsets(node, node.inputs) for node in self._nodes),
+        out_ports=tuple(port_offsets(node, node.outputs) for node in self._nodes),
+        num_inputs=len(self.inputs),
+        num_outputs=len(self.outputs),
+        edges=layout_edges(self))
+
+
+@inject
+def build_layout_graph(self, engine=Inject('gearbox/graph_layout/engine')):
+    """Updates the graphviz graph of the node with the current sizes of its
+    children, and returns its canonical description for the layout cache.
+    The layered engine does not need the graphviz graph, so its input is
+    used as the description instead.
+    """
+
+    if engine == 'layered':
+        return (engine, layered_graph(self))
+
+    labels = []
     for node in self._nodes:
         gvn = self.get_layout_node(node)
         try:
@@ -77,19 +139,15 @@ def hier_layout(self):
             pass
 
         if node._layout != minimized_layout:
-            # gvn.attr['label'] = gv_utils.get_node_record(node).replace(
-            #     '\n', '')
             node_layout_rec = gv_utils.get_node_record(node)
-            # print('-' * 60)
-            # print(f'Node layout for {node.model.name}')
-            # print('-' * 60)
-            # print(node_layout_rec)
             gvn.attr['label'] = node_layout_rec.replace('\n', '')
         else:
             gvn.attr['label'] = ""
             gvn.attr['width'] = 1 / 72
             gvn.attr['height'] = 1 / 72
 
+        labels.append(gvn.attr['label'])
+
     if not self.layout_graph.subgraphs():
         self.layout_graph.add_subgraph([
             self.layout_graph.get_node(f'i{i}')
@@ -104,88 +162,76 @@ def hier_layout(self):
                                        'sink',
                                        rank='same')
 
-    # for i in range(len(self.inputs)):
-    #     gvn = self.layout_graph.get_node(f'i{i}')
+    return (engine, tuple(labels), len(self.inputs), len(self.outputs), layout_edges(self))
 
-    # for i in range(len(self.outputs)):
-    #     gvn = self.layout_graph.get_node(f'o{i}')
 
-    # for pipe in self.pipes:
-    #     gve = self.get_layout_edge(pipe)
+@inject
+def compute_layout(self, engine=Inject('gearbox/graph_layout/engine')):
+    """Lays out the node subgraph and returns the positions of the children
+    and the ports, and the paths of the pipes.
+    """
 
-    self.layout_graph.layout(prog='dot')
+    if engine == 'layered':
+        return layered_layout(layered_graph(self))
 
-    # if self.model.name == '/riscv':
-    #     # if self.model.name == '':
-    #     self.layout_graph.draw('proba.png')
-    #     self.layout_graph.draw('proba.dot')
+    self.layout_graph.layout(prog='dot')
 
     # self.layout_graph.draw(f'{self.model.name.replace("/", "_")}.png')
     # self.layout_graph.draw(f'{self.model.name.replace("/", "_")}.dot')
 
-    def gv_point_load(point):
-        return tuple(float(num) for num in point.split(',')[-2:])
+    return layout_result(self, *gv_utils.graph_positions(self.layout_graph))
+
+
+def layout_result(self, nodes, edges):
+    """Converts the graphviz node and edge positions, given by their names
+    and keys, to the layout result of the node.
+    """
+
+    return {
+        'nodes': [gv_point_load(nodes[str(id(node))]) for node in self._nodes],
+        'inputs': [gv_point_load(nodes[f'i{i}']) for i in range(len(self.inputs))],
+        'outputs': [gv_point_load(nodes[f'o{i}']) for i in range(len(self.outputs))],
+        'pipes': [[gv_point_load(point) for point in edges[str(id(pipe))].split()]
+                  for pipe in self.pipes],
+    }
 
-    # if self.name:
-    #     import pdb; pdb.set_trace()
+
+def apply_layout(self, res):
+    # Kept for the incremental relayout, together with the child sizes the
+    # layout was made for
+    self.layout_res = res
+    self.layout_sizes = [(node.width, node.height) for node in self._nodes]
 
     padding_y = 40
     padding_x = -5
 
     bounding_box = None
-    # print(f"Layout for: {node.name}")
-    for node in self._nodes:
-        gvn = self.get_layout_node(node)
-        pos = gv_point_load(gvn.attr['pos'])
+    for node, pos in zip(self._nodes, res['nodes']):
         node_bounding_box = QtCore.QRectF(pos[0] - node.width / 2,
                                           pos[1] - node.height / 2, node.width,
                                           node.height)
-        # print(
-        #     f'  bb: {node.name}: {pos[0], pos[1], float(gvn.attr["width"])*72, float(gvn.attr["height"])*72} -> {node_bounding_box}'
-        # )
         node.setPos(node_bounding_box.x(), node_bounding_box.y())
         if bounding_box is None:
             bounding_box = node_bounding_box
         else:
             bounding_box = bounding_box.united(node_bounding_box)
 
-    if self.inputs:
-        port_height = self.inputs[0].boundingRect().height()
-
-        for i, p in enumerate(self.inputs):
-            gvn = self.layout_graph.get_node(f'i{i}')
-            pos = gv_point_load(gvn.attr['pos'])
-            node_bounding_box = QtCore.QRectF(pos[0] - port_height / 2,
-                                              pos[1] - port_height / 2 + 0.5,
-                                              port_height, port_height)
-            # print(
-            #     f'  bb: {p.name}: {pos[0], pos[1], float(gvn.attr["width"])*72, float(gvn.attr["height"])*72} -> {node_bounding_box}'
-            # )
-            p.setPos(node_bounding_box.x(), node_bounding_box.y())
-            bounding_box = bounding_box.united(node_bounding_box)
+    for ports, positions in ((self.inputs, res['inputs']), (self.outputs, res['outputs'])):
+        if not ports:
+            continue
 
-    if self.outputs:
-        port_height = self.outputs[0].boundingRect().height()
+        port_height = ports[0].boundingRect().height()
 
-        for i, p in enumerate(self.outputs):
-            gvn = self.layout_graph.get_node(f'o{i}')
-            pos = gv_point_load(gvn.attr['pos'])
+        for p, pos in zip(ports, positions):
             node_bounding_box = QtCore.QRectF(pos[0] - port_height / 2,
                                               pos[1] - port_height / 2 + 0.5,
                                               port_height, port_height)
-            # print(
-            #     f'  bb: {p.name}: {pos[0], pos[1], float(gvn.attr["width"])*72, float(gvn.attr["height"])*72} -> {node_bounding_box}'
-            # )
             p.setPos(node_bounding_box.x(), node_bounding_box.y())
             bounding_box = bounding_box.united(node_bounding_box)
 
-    for pipe in self.pipes:
-        gve = self.get_layout_edge(pipe)
-        path = [gv_point_load(point) for point in gve.attr['pos'].split()]
+    for pipe, path in zip(self.pipes, res['pipes']):
         pipe.layout_path = [QtCore.QPointF(p[0], p[1]) for p in path]
 
-        # max_y = max(max_y, *(p.y() for p in pipe.layout_path))
-
     self.layers = []
 
     class Layer(list):
@@ -311,11 +357,31 @@ def hier_expand(node, padding=40):
     # node.parent.layout()
 
 
-def hier_painter(self, painter, option, widget):
-    painter.save()
+def lod_painter(self, painter, color, top_color):
+    """Draws the node as plain rectangles when zoomed out"""
 
+    rect = self.boundingRect()
+    painter.fillRect(rect, color)
+    painter.fillRect(
+        QtCore.QRectF(rect.left(), rect.top(), rect.width(), min(20.0, rect.height())),
+        top_color)
+
+
+def hier_painter(self, painter, option, widget):
     rect = self.boundingRect()
     color = (self.color[0], self.color[1], self.color[2], 50)
+
+    if not lod_detailed(painter, option):
+        if self.collapsed:
+            top_color = QtGui.QColor(themify(self.status_color))
+        else:
+            top_color = QtGui.QColor(*self.border_color)
+
+        lod_painter(self, painter, QtGui.QColor(*color), top_color)
+        return
+
+    painter.save()
+
     painter.setBrush(QtGui.QColor(*color))
     painter.setPen(QtCore.Qt.NoPen)
     painter.drawRect(rect)
@@ -337,7 +403,7 @@ def hier_painter(self, painter, option, widget):
         painter.drawRect(rect)
 
     path = QtGui.QPainterPath()
-    path.addRect(rect)
+    path.addRect(rect.adjusted(0.5, 0.5, -0.5, -0.5))
     border_color = self.border_color
     if self.selected and NODE_SEL_BORDER_COLOR:
         border_color = NODE_SEL_BORDER_COLOR
@@ -349,11 +415,16 @@ def hier_painter(self, painter, option, widget):
 
 
 def node_painter(self, painter, option, widget):
+    if not lod_detailed(painter, option):
+        lod_painter(self, painter, QtGui.QColor(*self.color),
+                    QtGui.QColor(themify(self.status_color)))
+        return
+
     painter.save()
 
-    bg_border = 1.0
-    rect = QtCore.QRectF(0.5 - (bg_border / 2), 0.5 - (bg_border / 2),
-                         self._width + bg_border, self._height + bg_border)
+    bg_border = 1.5
+    rect = QtCore.QRectF(bg_border / 2, bg_border / 2,
+                         self._width - bg_border, self._height - bg_border)
     radius_x = 5
     radius_y = 5
     path = QtGui.QPainterPath()
@@ -385,10 +456,8 @@ def node_painter(self, painter, option, widget):
     if self.selected and NODE_SEL_BORDER_COLOR:
         border_width = 1.2
         border_color = QtGui.QColor(*NODE_SEL_BORDER_COLOR)
-    border_rect = QtCore.QRectF(rect.left() - (border_width / 2),
-                                rect.top() - (border_width / 2),
-                                rect.width() + border_width,
-                                rect.height() + border_width)
+    border_rect = rect.adjusted(border_width / 2, border_width / 2,
+                                -border_width / 2, -border_width / 2)
     path = QtGui.QPainterPath()
     path.addRoundedRect(border_rect, radius_x, radius_y)
     painter.setBrush(QtCore.Qt.NoBrush)
@@ -417,7 +486,7 @@ class NodeItem(AbstractNodeItem):
 
         self.layout_pipe_map = {}
 
-        self._text_item = QtWidgets.QGraphicsTextItem(self.name, self)
+        self._text_item = LodTextItem(self.name, self)
         self._input_items = {}
         self._output_items = {}
         self._nodes = []
@@ -432,9 +501,13 @@ class NodeItem(AbstractNodeItem):
 
         self.collapsed = False if parent is None else True
         self.layers = []
+        self.layout_task = None
+        self.layout_res = None
+        self.layout_sizes = []
 
     def setup_done(self):
         self._hide_single_port_labels()
+        self.update_cache_mode()
 
         self.layout()
 
@@ -497,22 +570,29 @@ class NodeItem(AbstractNodeItem):
             obj.hide()
 
         self.collapsed = True
+        self.update_cache_mode()
         self.size_expander(self)
-        self.graph.top.layout()
-        self.graph.ensureVisible(self)
+        self.relayout_visible()
         self.graph.node_expand_toggled.emit(False, self.model)
 
     def expand(self):
-        if not self.collapsed or not self.hierarchical:
+        if not self.collapsed:
+            return None
+
+        # Child views are created only once the node is first expanded
+        if self.model is not None:
+            self.model.create_child_views()
+
+        if not self.hierarchical:
             return None
 
         for obj in self.children:
             obj.show()
 
         self.collapsed = False
+        self.update_cache_mode()
         self.show()
-        self.graph.top.layout()
-        self.graph.ensureVisible(self)
+        self.relayout_visible()
         self.selected = True
         self.graph.node_expand_toggled.emit(True, self.model)
 
@@ -540,7 +620,7 @@ class NodeItem(AbstractNodeItem):
     def _add_port(self, port, display_name=True):
         port_item = PortItem(port, self)
         port_item.display_name = display_name
-        text = QtWidgets.QGraphicsTextItem(port_item.name, self)
+        text = LodTextItem(port_item.name, self)
         text.font().setPointSize(8)
         text.setFont(text.font())
         # text.setVisible(display_name)
@@ -560,14 +640,37 @@ class NodeItem(AbstractNodeItem):
         return port_item
 
     def set_status(self, status):
+        if self.apply_status(status):
+            scene = self.scene()
+            if scene is None:
+                self.update()
+            else:
+                scene.update_item(self)
+
+    def apply_status(self, status):
+        """Sets the status without repainting, and returns whether the colour
+        changed.
+        """
+
         self.status = status
         if self.model.hierarchical:
             status = f'{status}_hier'
 
         new_color = NODE_SIM_STATUS_COLOR[status]
-        if new_color != self.status_color:
-            self.status_color = new_color
-            self.update()
+        if new_color == self.status_color:
+            return False
+
+        self.status_color = new_color
+        return True
+
+    def update_cache_mode(self):
+        # Bodies of the collapsed nodes change only with their status, so they
+        # are rendered once and cached. Expanded nodes can be huge when zoomed
+        # in, and other painters draw outside of the bounding rect.
+        if self.collapsed and self.painter in (node_painter, hier_painter):
+            self.setCacheMode(self.DeviceCoordinateCache)
+        else:
+            self.setCacheMode(self.NoCache)
 
     @AbstractNodeItem.selected.setter
     def selected(self, selected=False):
@@ -896,3 +999,18 @@ class NodeItem(AbstractNodeItem):
 
     def layout(self):
         self._layout(self)
+
+    def relayout_visible(self):
+        # Layout might finish in the background, after which the node is at
+        # its new position
+        single_shot_connect(self.graph.layout_finished, self.ensure_visible)
+        self.relayout()
+
+    def ensure_visible(self):
+        self.graph.ensureVisible(self)
+
+    def relayout(self):
+        """Lays out the graph after the node was expanded or collapsed"""
+
+        from .layout_sched import relayout
+        relayout(self)
@@ -106,65 +106,73 @@ class PipeModel(NamedHierNode):
         self.svintf = reg['hdlgen/map'].get(intf, None)
 
         self.rtl = intf
+        self.view = None
 
         self.consumer_id = consumer_id
         output_port_model = intf.producer
         input_port_model = intf.consumers[consumer_id]
 
         if output_port_model.gear is parent.rtl:
-            try:
-                output_port = parent.view.inputs[output_port_model.index]
-            except IndexError:
-                node = DummyInNode(parent, output_port_model.index)
-                parent.view.add_node(node)
-                output_port = node.outputs[0]
-
             # parent.input_int_pipes[output_port_model.index] = self
             parent.input_int_pipes.append(self)
         else:
-            output_port = parent[output_port_model.gear.basename].view.outputs[
-                output_port_model.index]
-
             # parent.rtl_map[output_port_model.node].output_ext_pipes[
             #     output_port_model.index] = self
             parent.rtl_map[output_port_model.gear].output_ext_pipes.append(
                 self)
 
-        try:
-            if input_port_model.gear is parent.rtl:
-                try:
-                    input_port = parent.view.outputs[input_port_model.index]
-                except IndexError:
-                    node = DummyOutNode(parent, input_port_model.index)
-                    parent.view.add_node(node)
-                    input_port = node.inputs[0]
-
-                self.consumer = parent
-                self.consumer.output_int_pipes.append(self)
-            else:
-                input_port = parent[input_port_model.gear.
-                                    basename].view.inputs[input_port_model.
-                                                          index]
-                self.consumer = parent.rtl_map[input_port_model.gear]
-                self.consumer.input_ext_pipes.append(self)
-
-        except AttributeError:
-            import pdb
-            pdb.set_trace()
-
-        self.view = Pipe(output_port, input_port, parent.view, self)
-        self.parent.view.add_pipe(self.view)
+        if input_port_model.gear is parent.rtl:
+            self.consumer = parent
+            self.consumer.output_int_pipes.append(self)
+        else:
+            self.consumer = parent.rtl_map[input_port_model.gear]
+            self.consumer.input_ext_pipes.append(self)
 
         if self.consumer.related_issues:
             self.set_status('error')
         else:
             self.set_status('empty')
 
+    def create_view(self):
+        parent = self.parent
+        output_port_model = self.rtl.producer
+        input_port_model = self.rtl.consumers[self.consumer_id]
+
+        if output_port_model.gear is parent.rtl:
+            try:
+                output_port = parent.view.inputs[output_port_model.index]
+            except IndexError:
+                node = DummyInNode(parent, output_port_model.index)
+                parent.view.add_node(node)
+                output_port = node.outputs[0]
+        else:
+            output_port = parent[output_port_model.gear.basename].view.outputs[
+                output_port_model.index]
+
+        if input_port_model.gear is parent.rtl:
+            try:
+                input_port = parent.view.outputs[input_port_model.index]
+            except IndexError:
+                node = DummyOutNode(parent, input_port_model.index)
+                parent.view.add_node(node)
+                input_port = node.inputs[0]
+        else:
+            input_port = parent[input_port_model.gear.
+                                basename].view.inputs[input_port_model.index]
+
+        self.view = Pipe(output_port, input_port, parent.view, self)
+        self.parent.view.add_pipe(self.view)
+        self.view.set_status(self.status)
+
     @inject
-    def set_status(self, status, timestep=Inject('gearbox/timekeep')):
+    def set_status(self, status, batch=None, timestep=Inject('gearbox/timekeep')):
         self.status = (timestep, status)
         self.status = status
-        self.view.set_status(status)
+        if self.view is not None:
+            if batch is None:
+                self.view.set_status(status)
+            else:
+                batch.add(self.view, status)
 
     @property
     def description(self):
@@ -206,10 +214,19 @@ class PipeModel(NamedHierNode):
 
 
 class NodeModel(NamedHierNode):
+    """Model of a gear in the graph.
+
+    The whole model hierarchy is built upfront, but the Qt views are created
+    only for the children of the nodes being expanded, see
+    :meth:`create_child_views`. Until then, the view attribute is None.
+    """
+
     def __init__(self, gear, parent=None):
         super().__init__(parent=parent)
 
         self.rtl = gear
+        self.view = None
+        self.child_views_created = False
         reg['gearbox/graph_model_map'][gear] = self
 
         # self.input_ext_pipes = [None] * len(self.rtl.in_ports)
@@ -223,6 +240,38 @@ class NodeModel(NamedHierNode):
 
         self.rtl_map = {}
 
+        if self.hierarchical:
+            for child in self.rtl.child:
+                self.rtl_map[child] = NodeModel(child, self)
+
+            for child in self.rtl.local_intfs:
+                for i in range(len(child.consumers)):
+                    if isinstance(child.producer, HDLProducer):
+                        continue
+
+                    if child.consumers and isinstance(child.consumers[0], HDLConsumer):
+                        continue
+
+                    if child.producer is None:
+                        # TODO: This should be an error?
+                        continue
+
+                    self.rtl_map[child] = PipeModel(
+                        child, consumer_id=i, parent=self)
+
+        # import pdb; pdb.set_trace()
+        if self.on_error_path:
+            self.set_status('error')
+        else:
+            self.set_status('empty')
+
+        if parent is None:
+            self.create_view()
+            self.create_child_views()
+
+    def create_view(self):
+        parent = self.parent
+
         layout = hier_layout if self.hierarchical else node_layout
         painter = None
         try:
@@ -239,7 +288,7 @@ class NodeModel(NamedHierNode):
             pass
 
         self.view = NodeItem(
-            gear.basename,
+            self.rtl.basename,
             layout=layout,
             parent=(None if parent is None else parent.view),
             model=self)
@@ -249,40 +298,26 @@ class NodeModel(NamedHierNode):
             for port in self.rtl.in_ports + self.rtl.out_ports:
                 self.view._add_port(port)
 
-        if self.hierarchical:
-            for child in self.rtl.child:
-                self.rtl_map[child] = NodeModel(child, self)
-
-                if parent is not None:
-                    self.rtl_map[child].view.hide()
-
         self.setup_view(painter=painter)
+        self.view.set_status(self.status[1])
 
-        if self.hierarchical:
-            for child in self.rtl.local_intfs:
-                for i in range(len(child.consumers)):
-                    if isinstance(child.producer, HDLProducer):
-                        continue
+    def create_child_views(self):
+        if self.child_views_created:
+            return
 
-                    if child.consumers and isinstance(child.consumers[0], HDLConsumer):
-                        continue
+        self.child_views_created = True
 
-                    if child.producer is None:
-                        # TODO: This should be an error?
-                        continue
+        children = [c for c in self.child if isinstance(c, NodeModel)]
+        for child in children:
+            child.create_view()
 
-                    self.rtl_map[child] = PipeModel(
-                        child, consumer_id=i, parent=self)
-
-                    if parent is not None:
-                        self.rtl_map[child].view.hide()
+        # Pipes connect the ports of the child views, so they come last
+        for pipe in self.pipes:
+            pipe.create_view()
 
-
-        # import pdb; pdb.set_trace()
-        if self.on_error_path:
-            self.set_status('error')
-        else:
-            self.set_status('empty')
+        if self.parent is not None:
+            for child in children + self.pipes:
+                child.view.hide()
 
     def __getitem__(self, path):
         return super().__getitem__(path.replace('.', '/'))
@@ -309,9 +344,13 @@ class NodeModel(NamedHierNode):
         return False
 
     @inject
-    def set_status(self, status, timestep=Inject('gearbox/timekeep')):
+    def set_status(self, status, batch=None, timestep=Inject('gearbox/timekeep')):
         self.status = (timestep, status)
-        self.view.set_status(status)
+        if self.view is not None:
+            if batch is None:
+                self.view.set_status(status)
+            else:
+                batch.add(self.view, status)
 
     @property
     @inject
@@ -7,6 +7,7 @@ from .constants import (
     PIPE_DEFAULT_COLOR, PIPE_ACTIVE_COLOR, PIPE_HIGHLIGHT_COLOR,
     PIPE_STYLE_DASHED, PIPE_STYLE_DEFAULT, PIPE_STYLE_DOTTED, PIPE_WIDTH,
     IN_PORT, OUT_PORT, Z_VAL_PIPE, PIPE_WAITED_COLOR, PIPE_HANDSHAKED_COLOR)
+from .lod import LOD_THRESHOLDS, level_of_detail
 from .theme import themify
 
 PIPE_STYLES = {
@@ -23,6 +24,14 @@ PIPE_SIM_STATUS_COLOR = {
     'error': '@text-color-error'
 }
 
+PIPE_HEAT_COLD_COLOR = (50, 90, 160)
+PIPE_HEAT_HOT_COLOR = (224, 32, 32)
+
+
+def heat_color(heat):
+    return QtGui.QColor(*(int(c + (h - c) * heat)
+                          for c, h in zip(PIPE_HEAT_COLD_COLOR, PIPE_HEAT_HOT_COLOR)))
+
 
 class Pipe(QtWidgets.QGraphicsPathItem):
     """
@@ -45,6 +54,8 @@ class Pipe(QtWidgets.QGraphicsPathItem):
         self._output_port = output_port
         self.model = model
         self.layout_path = []
+        self.lod_path = QtGui.QPolygonF()
+        self.heat = None
         self.set_status("empty")
         # self.set_tooltip()
 
@@ -62,11 +73,38 @@ class Pipe(QtWidgets.QGraphicsPathItem):
         return f'{type(self)}({str(self)})'
 
     def set_status(self, status):
+        if self.apply_status(status):
+            self.update_view()
+
+    def apply_status(self, status):
+        """Sets the status without repainting, and returns whether the colour
+        changed.
+        """
+
         self.status = status
         new_color = themify(PIPE_SIM_STATUS_COLOR[status])
-        if new_color != self.color:
-            self.color = new_color
+        if new_color == self.color:
+            return False
+
+        self.color = new_color
+        return True
+
+    def set_heat(self, heat):
+        if heat != self.heat:
+            self.heat = heat
+            self.update_view()
+
+    def update_view(self):
+        scene = self.scene()
+        if scene is None:
             self.update()
+        else:
+            scene.update_item(self)
+
+    def boundingRect(self):
+        # Pen is chosen at paint time, and is the widest for the hottest pipes
+        margin = PIPE_WIDTH * 5 / 2
+        return self.path().boundingRect().adjusted(-margin, -margin, margin, margin)
 
     def mouseReleaseEvent(self, event):
         super().mouseReleaseEvent(event)
@@ -85,7 +123,10 @@ class Pipe(QtWidgets.QGraphicsPathItem):
         color = QtGui.QColor(self._color)
         pen_style = PIPE_STYLES.get(self.style)
 
-        if self.status == 'empty':
+        if self.heat is not None:
+            color = heat_color(self.heat)
+            pen_width = PIPE_WIDTH * (1 + 4 * self.heat)
+        elif self.status == 'empty':
             pen_width = PIPE_WIDTH
         else:
             pen_width = PIPE_WIDTH * 3
@@ -96,12 +137,22 @@ class Pipe(QtWidgets.QGraphicsPathItem):
             color = QtGui.QColor(*PIPE_HIGHLIGHT_COLOR)
             pen_style = PIPE_STYLES.get(PIPE_STYLE_DEFAULT)
 
+        lod = level_of_detail(painter, option)
+        if lod < LOD_THRESHOLDS['outline']:
+            painter.setPen(QtGui.QPen(color, pen_width))
+            painter.setRenderHint(painter.Antialiasing, False)
+            painter.drawPolyline(self.lod_path)
+            return
+
         pen = QtGui.QPen(color, pen_width)
         pen.setStyle(pen_style)
-        pen.setCapStyle(QtCore.Qt.RoundCap)
+
+        detailed = lod >= LOD_THRESHOLDS['detail']
+        if detailed:
+            pen.setCapStyle(QtCore.Qt.RoundCap)
 
         painter.setPen(pen)
-        painter.setRenderHint(painter.Antialiasing, True)
+        painter.setRenderHint(painter.Antialiasing, detailed)
         painter.drawPath(self.path())
 
     def spline(self, pos1, pos2, start=True):
@@ -136,6 +187,10 @@ class Pipe(QtWidgets.QGraphicsPathItem):
 
         self.setPath(path)
 
+        # Polyline through the ends of the spline segments, drawn when zoomed
+        # out
+        self.lod_path = QtGui.QPolygonF([qp_end] + self.layout_path[4::3] + [qp_start])
+
     def activate(self):
         self._active = True
         pen = QtGui.QPen(QtGui.QColor(*PIPE_HIGHLIGHT_COLOR), 2)
@@ -0,0 +1,382 @@
+import copy
+from typing import NamedTuple
+
+import numpy as np
+
+# Status codes are (ready << 1) | valid, same as in the dti_translate filter
+PIPE_STATUS = ('empty', 'active', 'waited', 'handshaked')
+STATUS_EMPTY = 0
+STATUS_ACTIVE = 1
+STATUS_WAITED = 2
+STATUS_HANDSHAKED = 3
+
+
+# Number of changes appended to the trace, after which the packed arrays
+# are rebuilt. Until then the newly appended changes are packed separately.
+TAIL_CHANGES = 1 << 16
+
+
+def signal_bits(sig, start=0):
+    # Columnar store interns '1' as value 1, see vcd_store.StoreWriter
+    if hasattr(sig, 'value_ids'):
+        return np.frombuffer(sig.value_ids, dtype=np.uint32)[start:] == 1
+
+    return np.fromiter((v == '1' for v in sig.values[start:]), dtype=bool, count=len(sig) - start)
+
+
+def signal_last(sig):
+    if sig is None or not len(sig):
+        return None
+
+    if hasattr(sig, 'value_ids'):
+        return sig.value_ids[-1]
+
+    return sig.values[-1]
+
+
+class SignalColumn:
+    """Change times and bits of a single signal, converted to arrays once and
+    extended in place as the trace grows.
+    """
+
+    def __init__(self):
+        self.times = np.empty(16, dtype=np.int64)
+        self.bits = np.empty(16, dtype=bool)
+        self.num = 0
+
+    def update(self, sig, start):
+        """Converts the changes of the signal starting from start. The change
+        before the new ones is converted again, since a change appended at
+        the same time overwrites it."""
+
+        times = np.frombuffer(sig.times, dtype=np.uint64)[start:].astype(np.int64)
+        num = start + len(times)
+
+        if num > len(self.times):
+            size = max(num, 2 * len(self.times))
+            self.times = np.resize(self.times, size)
+            self.bits = np.resize(self.bits, size)
+
+        self.times[start:num] = times
+        self.bits[start:num] = signal_bits(sig, start)
+        self.num = num
+
+
+def value_at(times, bits, at):
+    """Returns the values of the signal given by its change times and bits,
+    at the times from at."""
+    pos = np.searchsorted(times, at, side='right') - 1
+    values = np.zeros(len(at), dtype=np.uint8)
+    found = pos >= 0
+    values[found] = bits[pos[found]]
+    return values
+
+
+class PipeIntervals:
+    """Intervals of constant status of a single pipe, with the running counts
+    of the stalled and the handshaked samples before each interval, so that
+    the sample counts over any window are found with two binary searches.
+
+    The pipe is sampled at the multiples of step. As the trace grows, only
+    the intervals starting from the last one are computed anew.
+    """
+
+    def __init__(self, step):
+        self.step = step
+        self.num = 0
+        self.times = np.empty(16, dtype=np.int64)
+        self.samples = np.empty(16, dtype=np.int64)
+        self.codes = np.empty(16, dtype=np.uint8)
+        # Samples before each interval, which were stalled and handshaked
+        self.cum = np.empty((16, 2), dtype=np.int64)
+
+    def update(self, valid, ready):
+        """Extends the intervals with the changes of the valid and ready
+        signals, given as (times, bits) pairs."""
+
+        # Last interval is recomputed, since its status might have been
+        # overwritten, or it might have been extended
+        start = self.num - 1 if self.num else 0
+        t0 = self.times[start] if self.num else 0
+
+        times = [np.array([t0], dtype=np.int64)]
+        for sig_times, _ in (valid, ready):
+            times.append(sig_times[np.searchsorted(sig_times, t0, side='left'):])
+
+        times = np.unique(np.concatenate(times))
+        codes = value_at(*valid, times) | (value_at(*ready, times) << 1)
+        samples = -(-times // self.step)
+
+        num = start + len(times)
+        if num > len(self.times):
+            size = max(num, 2 * len(self.times))
+            self.times = np.resize(self.times, size)
+            self.samples = np.resize(self.samples, size)
+            self.codes = np.resize(self.codes, size)
+            self.cum = np.resize(self.cum, (size, 2))
+
+        self.times[start:num] = times
+        self.samples[start:num] = samples
+        self.codes[start:num] = codes
+
+        if start == 0:
+            self.cum[0] = 0
+
+        # Samples of each interval are counted into the running counts of
+        # the interval after it
+        lens = np.diff(self.samples[start:num])
+        prev = self.codes[start:num - 1]
+        counts = np.stack((lens * (prev == STATUS_ACTIVE), lens * (prev == STATUS_HANDSHAKED)),
+                          axis=1)
+        self.cum[start + 1:num] = self.cum[start] + np.cumsum(counts, axis=0)
+
+        self.num = num
+
+    def counts(self, sample):
+        """Returns the numbers of the stalled and the handshaked samples
+        before the sample."""
+        k = np.searchsorted(self.samples[:self.num], sample, side='right') - 1
+        if k < 0:
+            return np.zeros(2, dtype=np.int64)
+
+        code = self.codes[k]
+        tail = sample - self.samples[k]
+        return self.cum[k] + (tail * (code == STATUS_ACTIVE), tail * (code == STATUS_HANDSHAKED))
+
+
+class PackedChanges:
+    """Changes of many signals packed into a single sorted array of keys:
+    signal_index * span + time. A lookup of all the signal values at some
+    time is then a single vectorized binary search.
+    """
+
+    def __init__(self, times, bits):
+        lens = np.array([len(t) for t in times], dtype=np.int64)
+        self.starts = np.concatenate(([0], np.cumsum(lens)[:-1])).astype(np.int64)
+
+        all_times = np.concatenate(times) if times else np.empty(0, dtype=np.int64)
+        self.span = int(all_times.max()) + 1 if len(all_times) else 1
+        self.max_time = self.span - 1
+
+        sig_ids = np.repeat(np.arange(len(times), dtype=np.int64), lens)
+        self.keys = sig_ids * self.span + all_times
+        self.bits = np.concatenate(bits) if bits else np.empty(0, dtype=bool)
+        self.base = np.arange(len(times), dtype=np.int64) * self.span
+
+    def lookup(self, times, values):
+        """Writes the values of the signals at the times into the values
+        matrix, where the signals have a change at or before the time."""
+
+        # Times past the end hold the last values, so clamping them keeps the
+        # query keys within their signal segment
+        query = self.base[:, None] + np.minimum(times, self.max_time)[None, :]
+
+        pos = np.searchsorted(self.keys, query, side='right') - 1
+        found = pos >= self.starts[:, None]
+        values[found] = self.bits[pos[found]]
+
+
+class PipeStatusEngine:
+    """Evaluates handshake statuses of many pipes at once.
+
+    The valid/ready changes of all the pipes are kept packed, see
+    PackedChanges. As the trace grows, only the newly appended changes are
+    converted and packed, into a separate tail, which is looked up after
+    the head and merged into it once it grows large.
+    """
+
+    def __init__(self, trace, pipes, handshake_signals):
+        self.trace = trace
+        self.pipes = list(pipes)
+        self.rows = {p: i for i, p in enumerate(self.pipes)}
+        self.signal_names = [name for sigs in handshake_signals for name in sigs]
+        self.columns = [SignalColumn() for _ in self.signal_names]
+        self._lens = [0] * len(self.signal_names)
+        self._lasts = [None] * len(self.signal_names)
+        self._head_lens = None
+        self.head = None
+        self.tail = None
+        self.max_time = 0
+        self.intervals = {}
+        self._stats = None
+
+    def _signals(self):
+        for name in self.signal_names:
+            try:
+                yield self.trace[name]
+            except KeyError:
+                yield None
+
+    def refresh(self):
+        if self.trace is None:
+            return
+
+        sigs = list(self._signals())
+        lens = [0 if s is None else len(s) for s in sigs]
+
+        # A change appended at the same time as the last one overwrites it,
+        # without changing the number of changes
+        lasts = [signal_last(s) for s in sigs]
+        if lens == self._lens and lasts == self._lasts and self.head is not None:
+            return
+
+        for i, s in enumerate(sigs):
+            if s is not None and (lens[i], lasts[i]) != (self._lens[i], self._lasts[i]):
+                self.columns[i].update(s, max(min(self._lens[i], lens[i]) - 1, 0))
+
+        self._lens = lens
+        self._lasts = lasts
+
+        # A signal shorter than when the head was packed means the trace was
+        # rewound, so its changes in the head are stale
+        if (self.head is None or any(n < h for n, h in zip(lens, self._head_lens))
+                or sum(lens) - sum(self._head_lens) > TAIL_CHANGES):
+            self.head = PackedChanges([c.times[:n] for c, n in zip(self.columns, lens)],
+                                      [c.bits[:n] for c, n in zip(self.columns, lens)])
+            self._head_lens = lens
+            self.tail = None
+            self.max_time = self.head.max_time
+            return
+
+        # The last change of each signal in the head is repeated in the tail,
+        # since it might have been overwritten
+        starts = [max(h - 1, 0) for h in self._head_lens]
+        self.tail = PackedChanges(
+            [c.times[s:n] for c, s, n in zip(self.columns, starts, lens)],
+            [c.bits[s:n] for c, s, n in zip(self.columns, starts, lens)])
+        self.max_time = max(self.head.max_time, self.tail.max_time)
+
+    def snapshot(self):
+        """Returns a copy of the engine frozen at the current state of the trace.
+        Its arrays are never modified afterwards, so it can be queried from
+        another thread while the trace keeps growing.
+        """
+
+        self.refresh()
+        snap = copy.copy(self)
+        snap.trace = None
+        snap.intervals = {}
+        snap._stats = None
+        return snap
+
+    def _values(self, times):
+        times = np.asarray(times, dtype=np.int64)
+        values = np.zeros((len(self.signal_names), len(times)), dtype=np.uint8)
+        if self.head is None:
+            return values
+
+        # Changes in the tail are later than the ones in the head, so they
+        # take precedence
+        self.head.lookup(times, values)
+        if self.tail is not None:
+            self.tail.lookup(times, values)
+
+        return values
+
+    def over(self, times):
+        """Returns the matrix of status codes, one row per pipe, one column per
+        time from times.
+        """
+
+        self.refresh()
+
+        if not self.pipes:
+            return np.zeros((0, len(times)), dtype=np.uint8)
+
+        values = self._values(times)
+        return values[0::2] | (values[1::2] << 1)
+
+    def at(self, time):
+        return self.over([time])[:, 0]
+
+    def statuses(self, time):
+        codes = self.at(time)
+        return {p: PIPE_STATUS[c] for p, c in zip(self.pipes, codes)}
+
+    def update_intervals(self, step):
+        """Brings the status intervals of the pipes up to date with the
+        trace, updating only the pipes whose signals changed."""
+
+        intervals = self.intervals.get(step, None)
+        if intervals is None:
+            intervals = self.intervals[step] = [[PipeIntervals(step), None] for _ in self.pipes]
+
+        for row, entry in enumerate(intervals):
+            state = (tuple(self._lens[2 * row:2 * row + 2]), tuple(self._lasts[2 * row:2 * row + 2]))
+            if state == entry[1]:
+                continue
+
+            # The trace was rewound, see refresh()
+            if entry[1] is not None and any(n < m for n, m in zip(state[0], entry[1][0])):
+                entry[0] = PipeIntervals(step)
+
+            entry[0].update(*((c.times[:n], c.bits[:n]) for c, n in zip(
+                self.columns[2 * row:2 * row + 2], state[0])))
+            entry[1] = state
+
+        return [pipe_intervals for pipe_intervals, _ in intervals]
+
+    def stats(self, start, end, step=10):
+        """Aggregates the statuses of all the pipes over the times from start
+        to end, sampled at the multiples of step. Returns the per-pipe counts
+        of handshaked, stalled (valid but not ready) and occupied (valid)
+        samples.
+
+        The counts are found from the status intervals of the pipes, hence
+        the cost does not depend on the width of the time window. The last
+        result is kept, since the statuses are queried by multiple views in
+        the same timestep.
+        """
+
+        self.refresh()
+
+        key = (start, end, step, tuple(self._lens), tuple(self._lasts))
+        if self._stats is not None and self._stats[0] == key:
+            return self._stats[1]
+
+        first = -(-start // step)
+        last = max(first, -(-end // step))
+
+        stalls = np.zeros(len(self.pipes), dtype=np.int64)
+        handshakes = np.zeros(len(self.pipes), dtype=np.int64)
+        for row, intervals in enumerate(self.update_intervals(step)):
+            stalls[row], handshakes[row] = intervals.counts(last) - intervals.counts(first)
+
+        stats = PipeStats(last - first, handshakes, stalls, stalls + handshakes)
+        self._stats = (key, stats)
+        return stats
+
+
+class PipeStat(NamedTuple):
+    cycles: int
+    handshakes: int
+    stalls: int
+    utilization: float
+    occupancy: float
+
+    @property
+    def stall_ratio(self):
+        return self.stalls / max(self.cycles, 1)
+
+
+class PipeStats(NamedTuple):
+    cycles: int
+    handshakes: np.ndarray
+    stalls: np.ndarray
+    occupied: np.ndarray
+
+    @property
+    def utilization(self):
+        return self.handshakes / max(self.cycles, 1)
+
+    @property
+    def stall_ratio(self):
+        return self.stalls / max(self.cycles, 1)
+
+    @property
+    def occupancy(self):
+        return self.occupied / max(self.cycles, 1)
+
+    def pipe_stat(self, row):
+        return PipeStat(self.cycles, int(self.handshakes[row]), int(self.stalls[row]),
+                        float(self.utilization[row]), float(self.occupancy[row]))
@@ -5,6 +5,7 @@ from pygears.core.port import InPort
 from .constants import (IN_PORT, OUT_PORT, PORT_HOVER_COLOR,
                         PORT_HOVER_BORDER_COLOR, PORT_ACTIVE_COLOR,
                         PORT_ACTIVE_BORDER_COLOR, Z_VAL_PORT)
+from .lod import lod_detailed
 
 
 class PortItem(QtWidgets.QGraphicsItem):
@@ -58,6 +59,9 @@ class PortItem(QtWidgets.QGraphicsItem):
             return self.parentItem().mapToParent(rel_pos)
 
     def paint(self, painter, option, widget):
+        if not lod_detailed(painter, option):
+            return
+
         painter.save()
 
         # rect = QtCore.QRectF(0.0, 0.8, self._width, self._height)
@@ -4,6 +4,7 @@ import os
 import queue
 import runpy
 import sys
+import time
 
 from PySide2 import QtCore, QtWidgets
 
@@ -11,10 +12,13 @@ from pygears import MultiAlternativeError
 from pygears.conf import Inject, PluginBase, inject, reg
 from pygears.conf.trace import pygears_excepthook, log_exception
 from pygears.sim import SimFinish, sim
+from pygears.sim import timestep as sim_timestep
 from pygears.sim.extens.sim_extend import SimExtend
 from pygears.sim.modules import SimVerilated
 
+from .breakpoints import BreakpointEngine, TimestepBreakpoint
 from .node_model import find_cosim_modules
+from .sim_proc import SimProcess
 
 # from jinja2.debug import fake_exc_info
 
@@ -26,11 +30,13 @@ class EmptyHierarchy(Exception):
 class Gearbox(QtCore.QObject, SimExtend):
     sim_event = QtCore.Signal(str)
 
+    @inject
     def __init__(self,
                  live=True,
                  reload=True,
                  standalone=False,
-                 sim_queue=None):
+                 sim_queue=None,
+                 refresh_interval=Inject('gearbox/sim_refresh_interval')):
 
         QtCore.QObject.__init__(self)
         self.loop = QtCore.QEventLoop(self)
@@ -41,7 +47,9 @@ class Gearbox(QtCore.QObject, SimExtend):
         # if self.queue is None:
         #     self.queue = queue.Queue()
 
-        self.breakpoints = set()
+        self.breakpoints = BreakpointEngine()
+        self.refresh_interval = refresh_interval
+        self.refresh_time = 0
         self.live = live
         self.done = False
         self.reload = reload
@@ -57,51 +65,40 @@ class Gearbox(QtCore.QObject, SimExtend):
         SimExtend.__init__(self)
         return self
 
-    def _should_break(self):
-        triggered = False
-        discard = []
-
-        for b in self.breakpoints:
-            trig, keep = b()
-            if trig:
-                triggered = True
-
-            if not keep:
-                discard.append(b)
-
-        self.breakpoints.difference_update(discard)
+    @property
+    def timestep(self):
+        return sim_timestep()
 
-        return triggered
+    def restore(self, timestep):
+        # Checkpoints are only taken of the simulator process
+        return False
 
     def cont(self):
         QtCore.QMetaObject.invokeMethod(self.loop, 'quit',
                                         QtCore.Qt.AutoConnection)
 
+    def refresh(self):
+        # The GUI is refreshed at most once per refresh interval of wall-clock
+        # time while the simulation runs freely, regardless of how many
+        # timesteps were simulated in between
+        now = time.monotonic()
+        if now - self.refresh_time >= self.refresh_interval:
+            self.refresh_time = now
+            self.sim_event.emit('refresh')
+
     def handle_event(self, name):
         if self.done:
             return
 
-        # print(f'{timestep()} : {name}, done: {self.done}')
-        if (name in ['after_cleanup', 'before_run']
-                or (name == 'after_timestep' and self._should_break())):
-
-            self.running = False
-            self.sim_event.emit(name)
-
-            QtCore.QThread.currentThread().eventDispatcher().processEvents(
-                QtCore.QEventLoop.AllEvents)
+        self.running = False
+        self.sim_event.emit(name)
 
-            self.loop.exec_()
-            self.running = True
-        else:
-            # print("Here?")
-            QtCore.QThread.yieldCurrentThread()
-            QtCore.QThread.currentThread().usleep(10)
-            # QtCore.QThread.currentThreadId().msleep(10)
-            # Let GUI thread do some work
-            # time.sleep(0.0001)
+        QtCore.QThread.currentThread().eventDispatcher().processEvents(
+            QtCore.QEventLoop.AllEvents)
 
-        # print('Back to the simulator')
+        self.loop.exec_()
+        self.running = True
+        self.refresh_time = time.monotonic()
 
         if self.done and not name == 'after_cleanup':
             raise SimFinish
@@ -121,7 +118,14 @@ class Gearbox(QtCore.QObject, SimExtend):
     #     self.handle_event('at_exit')
 
     def after_timestep(self, sim, timestep):
-        self.handle_event('after_timestep')
+        bps = self.breakpoints
+        if timestep >= bps.due and bps.check(timestep):
+            self.handle_event('after_timestep')
+        elif self.done:
+            raise SimFinish
+        else:
+            self.refresh()
+
         return True
 
     def after_cleanup(self, sim):
@@ -207,6 +211,7 @@ class PyGearsClient(QtCore.QObject):
     # These are called automatically by handle_event
     after_cleanup = QtCore.Signal()
     after_timestep = QtCore.Signal()
+    refresh = QtCore.Signal()
     at_exit = QtCore.Signal()
 
     @inject
@@ -240,8 +245,37 @@ class PyGearsClient(QtCore.QObject):
         else:
             return False
 
-    def breakpoint(self, func):
-        self.pygears_proc.breakpoints.add(func)
+    @property
+    def timestep(self):
+        if self.pygears_proc:
+            return self.pygears_proc.timestep
+        else:
+            return None
+
+    def breakpoint(self, bp):
+        self.pygears_proc.breakpoints.add(bp)
+        return bp
+
+    def remove_breakpoint(self, bp):
+        if self.simulating:
+            self.pygears_proc.breakpoints.remove(bp)
+
+    def break_at(self, timestep):
+        return self.breakpoint(TimestepBreakpoint(timestep))
+
+    def clear_breakpoints(self):
+        if self.simulating:
+            self.pygears_proc.breakpoints.clear()
+
+    def pause(self):
+        if self.simulating:
+            self.pygears_proc.breakpoints.pause()
+
+    def restore(self, timestep):
+        if self.simulating:
+            return self.pygears_proc.restore(timestep)
+
+        return False
 
     def start_thread(self):
         self.thrd = QtCore.QThread()
@@ -265,10 +299,15 @@ class PyGearsClient(QtCore.QObject):
         f = self.invoke_queue.get()
         f()
 
-    def run_sim(self):
+    @inject
+    def run_sim(self, sim_process=Inject('gearbox/sim_process')):
         print("Running sim")
 
-        self.pygears_proc = Gearbox()
+        if sim_process:
+            self.pygears_proc = SimProcess()
+        else:
+            self.pygears_proc = Gearbox()
+
         self.pygears_proc.sim_event.connect(self.handle_event)
         self.simulating = True
 
@@ -426,3 +465,7 @@ class MainWindowPlugin(PluginBase):
     def bind(cls):
         reg['gearbox/model_script_name'] = None
         reg['gearbox/compilation_log_fn'] = None
+        reg.confdef('gearbox/sim_refresh_interval', default=0.1)
+        reg.confdef('gearbox/sim_process', default=False)
+        reg.confdef('gearbox/sim_checkpoint_interval', default=100000)
+        reg.confdef('gearbox/sim_checkpoint_limit', default=8)
@@ -119,6 +119,10 @@ def load_str_template(template):
 
 class GraphStatusSaver(HierYielderBase):
     def NodeModel(self, node):
+        # Nodes without views were never expanded, nor were their children
+        if node.view is None:
+            return True
+
         if not node.view.collapsed and bool(node.name):
             yield node.name[1:]
 
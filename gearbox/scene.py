@@ -4,6 +4,34 @@ from pygears.conf import Inject, inject, reg
 
 from .theme import ThemePlugin
 
+# Dirty rects closer than this are repainted together
+UPDATE_MERGE_MARGIN = 20
+
+
+def merge_rects(rects, margin=UPDATE_MERGE_MARGIN):
+    """Merges the rects that overlap or are within the margin of each other,
+    so that the distant ones are not repainted as a single rect spanning
+    everything in between.
+    """
+
+    merged = []
+    for rect in rects:
+        grown = rect.adjusted(-margin, -margin, margin, margin)
+
+        # Merged rect might have grown to reach the rects merged before
+        i = 0
+        while i < len(merged):
+            if merged[i].intersects(grown):
+                rect = rect.united(merged.pop(i))
+                grown = rect.adjusted(-margin, -margin, margin, margin)
+                i = 0
+            else:
+                i += 1
+
+        merged.append(rect)
+
+    return merged
+
 
 class NodeScene(QtWidgets.QGraphicsScene):
     @inject
@@ -15,6 +43,11 @@ class NodeScene(QtWidgets.QGraphicsScene):
         self.background_color = QtGui.QColor(background_color)
         self.grid_color = grid_color
         self.grid = True
+        self.setItemIndexMethod(self.BspTreeIndex)
+
+        # Items whose appearance changed while they were out of view
+        self.deferred = set()
+        self.visible_rect = None
 
     def __repr__(self):
         return '{}.{}(\'{}\')'.format(self.__module__, self.__class__.__name__,
@@ -74,6 +107,52 @@ class NodeScene(QtWidgets.QGraphicsScene):
     def viewer(self):
         return self.views()[0] if self.views() else None
 
+    def update_item(self, item):
+        """Repaints the item if it is in view, otherwise defers the repaint
+        until it gets scrolled into view.
+        """
+
+        if self.visible_rect is None or item.sceneBoundingRect().intersects(self.visible_rect):
+            item.update()
+        else:
+            self.deferred.add(item)
+
+    def update_items(self, items):
+        """Repaints the items that are in view, invalidating the scene once
+        per cluster of nearby items, and defers the rest.
+        """
+
+        rects = []
+        for item in items:
+            rect = item.sceneBoundingRect()
+            if self.visible_rect is not None and not rect.intersects(self.visible_rect):
+                self.deferred.add(item)
+            elif item.cacheMode() != item.NoCache:
+                # Cached items need their cache invalidated
+                item.update()
+            else:
+                rects.append(rect)
+
+        for rect in merge_rects(rects):
+            self.update(rect)
+
+    def set_visible_rect(self, rect):
+        self.visible_rect = rect
+
+        if self.deferred:
+            exposed = [item for item in self.deferred if item.sceneBoundingRect().intersects(rect)]
+            for item in exposed:
+                self.deferred.discard(item)
+                item.update()
+
+    def begin_bulk_move(self):
+        # Keeping the BSP tree up to date while all the items are being moved
+        # costs more than rebuilding it afterwards
+        self.setItemIndexMethod(self.NoIndex)
+
+    def end_bulk_move(self):
+        self.setItemIndexMethod(self.BspTreeIndex)
+
 
 class ScenePlugin(ThemePlugin):
     @classmethod
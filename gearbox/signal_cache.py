@@ -0,0 +1,87 @@
+import hashlib
+import os
+import pickle
+
+from .vcd_index import read_vcd_header
+
+SIGNAL_CACHE_EXT = '.signals'
+
+
+def design_hash(gear):
+    h = hashlib.sha1()
+    stack = [gear]
+    while stack:
+        g = stack.pop()
+        h.update(g.name.encode())
+        for p in g.in_ports + g.out_ports:
+            h.update(f'{p.basename}:{p.dtype!r}'.encode())
+
+        stack.extend(reversed(g.child))
+
+    return h.hexdigest()
+
+
+def signal_cache_path(trace_fn):
+    return trace_fn + SIGNAL_CACHE_EXT
+
+
+def signal_cache_key(trace_fn, gear):
+    key = (os.path.abspath(trace_fn), design_hash(gear))
+
+    # FIFOs and shared memory traces are recreated on each run, so only a
+    # regular file can be identified by its size and modification time
+    if os.path.isfile(trace_fn):
+        st = os.stat(trace_fn)
+        key += (st.st_size, st.st_mtime_ns)
+
+    return key
+
+
+def load_signal_cache(trace_fn, gear):
+    try:
+        with open(signal_cache_path(trace_fn), 'rb') as f:
+            key, names = pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        return None
+
+    if key != signal_cache_key(trace_fn, gear):
+        return None
+
+    return names
+
+
+def save_signal_cache(trace_fn, gear, names):
+    cache_fn = signal_cache_path(trace_fn)
+    try:
+        with open(cache_fn + '.tmp', 'wb') as f:
+            pickle.dump((signal_cache_key(trace_fn, gear), names), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(cache_fn + '.tmp', cache_fn)
+    except OSError:
+        pass
+
+
+def trace_signals(trace_fn, gear):
+    """Returns the list of trace signals named as GtkWave facilities, without
+    asking GtkWave. They are taken from the cache left by the previous run if
+    the trace did not change since, otherwise they are read from the header
+    of the VCD file and cached. Returns None if neither is available.
+    """
+
+    names = load_signal_cache(trace_fn, gear)
+    if names is not None:
+        return names
+
+    if os.path.isfile(trace_fn):
+        try:
+            index = read_vcd_header(trace_fn)
+        except (OSError, UnicodeDecodeError):
+            index = None
+
+        if index is not None:
+            names = list(index.names)
+            save_signal_cache(trace_fn, gear, names)
+            return names
+
+    return None
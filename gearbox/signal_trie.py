@@ -0,0 +1,206 @@
+import bisect
+import hashlib
+import os
+import pickle
+from array import array
+
+SIGNAL_TRIE_EXT = '.sigtrie'
+SIGNAL_TRIE_VERSION = 1
+
+
+def _split(name):
+    return name.split('.')
+
+
+class SignalTrie:
+    """Index of hierarchical signal names, split on dots.
+
+    Names are kept sorted by their path elements, so that the signals of each
+    subtree occupy a contiguous slice of the name list. Trie nodes are numbered
+    level by level, which makes the children of each node contiguous as well.
+    Nodes are stored in flat arrays, holding their key, the bounds of their
+    slice of names and the range of their children, so that the whole trie can
+    be persisted and loaded cheaply.
+    """
+
+    root = 0
+
+    def __init__(self, names=None):
+        if names is None:
+            return
+
+        paths = sorted(_split(n) for n in names)
+        self.names = ['.'.join(p) for p in paths]
+
+        self.keys = ['']
+        self.lo = array('Q', [0])
+        self.hi = array('Q', [len(paths)])
+        self.leaf = array('B', [0])
+        self.first = array('Q', [0])
+        self.count = array('Q', [0])
+
+        level = [self.root]
+        depth = 0
+        while level:
+            next_level = []
+            # Within each node's slice, the keys at this depth are sorted too
+            column = [p[depth] if len(p) > depth else '' for p in paths]
+            for node in level:
+                i, hi = self.lo[node], self.hi[node]
+
+                # Name ending at this node sorts before the ones below it
+                if i < hi and len(paths[i]) == depth:
+                    self.leaf[node] = 1
+                    while i < hi and len(paths[i]) == depth:
+                        i += 1
+
+                self.first[node] = len(self.keys)
+                while i < hi:
+                    key = column[i]
+                    j = bisect.bisect_right(column, key, i, hi)
+                    next_level.append(len(self.keys))
+                    self.keys.append(key)
+                    self.lo.append(i)
+                    self.hi.append(j)
+                    self.leaf.append(0)
+                    self.first.append(0)
+                    self.count.append(0)
+                    i = j
+
+                self.count[node] = len(self.keys) - self.first[node]
+
+            level = next_level
+            depth += 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def child(self, node, key):
+        first = self.first[node]
+        end = first + self.count[node]
+        i = bisect.bisect_left(self.keys, key, first, end)
+        if i < end and self.keys[i] == key:
+            return i
+
+        return None
+
+    def children(self, node):
+        first = self.first[node]
+        for i in range(first, first + self.count[node]):
+            yield self.keys[i], i
+
+    def find(self, path):
+        node = self.root
+        for key in path:
+            node = self.child(node, key)
+            if node is None:
+                return None
+
+        return node
+
+    def signals(self, node):
+        return self.names[self.lo[node]:self.hi[node]]
+
+    def own_signals(self, node):
+        if not self.leaf[node]:
+            return []
+
+        first = self.first[node]
+        end = self.lo[first] if self.count[node] else self.hi[node]
+        return self.names[self.lo[node]:end]
+
+    def under(self, name):
+        """Returns all the signals hierarchically below the name"""
+
+        node = self.find(_split(name))
+        if node is None or not self.count[node]:
+            return []
+
+        first = self.first[node]
+        return self.names[self.lo[first]:self.hi[first + self.count[node] - 1]]
+
+    def prefixed(self, prefix):
+        """Returns all the signals whose names start with the prefix"""
+
+        *path, last = _split(prefix)
+        node = self.find(path)
+        if node is None:
+            return []
+
+        # Child keys are sorted, so the ones starting with the last element of
+        # the prefix are adjacent, and so are their slices
+        first = self.first[node]
+        end = first + self.count[node]
+        start = bisect.bisect_left(self.keys, last, first, end)
+        stop = start
+        while stop < end and self.keys[stop].startswith(last):
+            stop += 1
+
+        if start == stop:
+            return []
+
+        return self.names[self.lo[start]:self.hi[stop - 1]]
+
+    def __getstate__(self):
+        return {
+            'names': self.names,
+            'keys': self.keys,
+            'arrays': {
+                k: getattr(self, k).tobytes()
+                for k in ('lo', 'hi', 'leaf', 'first', 'count')
+            }
+        }
+
+    def __setstate__(self, state):
+        self.names = state['names']
+        self.keys = state['keys']
+        for k, data in state['arrays'].items():
+            arr = array('B' if k == 'leaf' else 'Q')
+            arr.frombytes(data)
+            setattr(self, k, arr)
+
+
+def signal_trie_path(trace_fn):
+    return trace_fn + SIGNAL_TRIE_EXT
+
+
+def _names_digest(names):
+    h = hashlib.sha1()
+    for n in names:
+        h.update(n.encode())
+        h.update(b'\n')
+
+    return h.digest()
+
+
+def load_signal_trie(names, cache_fn=None):
+    """Returns the trie for the list of names, reusing the one persisted at
+    cache_fn if it was built for the same list.
+    """
+
+    if cache_fn is None:
+        return SignalTrie(names)
+
+    digest = _names_digest(names)
+
+    try:
+        with open(cache_fn, 'rb') as f:
+            version, cached_digest, trie = pickle.load(f)
+
+        if version == SIGNAL_TRIE_VERSION and cached_digest == digest:
+            return trie
+    except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError):
+        pass
+
+    trie = SignalTrie(names)
+
+    try:
+        tmp_fn = cache_fn + '.tmp'
+        with open(tmp_fn, 'wb') as f:
+            pickle.dump((SIGNAL_TRIE_VERSION, digest, trie), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_fn, cache_fn)
+    except OSError:
+        pass
+
+    return trie
@@ -1,18 +1,58 @@
 from PySide2.QtCore import Qt
 from pygears.conf import Inject, inject
 from .actions import Interactive, shortcut
-from .main_window import register_prefix
+from .breakpoints import StepsBreakpoint
+from .main_window import message, register_prefix
 
 register_prefix(None, (Qt.Key_Space, Qt.Key_S), 'simulator')
 
 
 @inject
 def step_simulator(sim_bridge=Inject('gearbox/sim_bridge')):
-    sim_bridge.breakpoint(lambda: (True, False))
+    sim_bridge.pause()
     if not sim_bridge.running:
         sim_bridge.cont()
 
 
+@inject
+def pause_simulator(sim_bridge=Inject('gearbox/sim_bridge')):
+    sim_bridge.pause()
+
+
+@inject
+def run_steps(steps=Interactive('Steps: '),
+              sim_bridge=Inject('gearbox/sim_bridge'),
+              timekeep=Inject('gearbox/timekeep')):
+
+    try:
+        steps = int(steps)
+    except (TypeError, ValueError):
+        return
+
+    sim_bridge.breakpoint(StepsBreakpoint(steps, timekeep.max_timestep))
+    if not sim_bridge.running:
+        sim_bridge.cont()
+
+
+@inject
+def restore_simulator(
+        time=Interactive('Restore time: '), sim_bridge=Inject('gearbox/sim_bridge')):
+
+    try:
+        time = int(time)
+    except (TypeError, ValueError):
+        return
+
+    if not sim_bridge.restore(time):
+        message(f'No checkpoint taken before {time}. Checkpoints are only taken when '
+                'simulating in a separate process')
+
+
+@inject
+def clear_breakpoints(sim_bridge=Inject('gearbox/sim_bridge')):
+    sim_bridge.clear_breakpoints()
+
+
 @inject
 def cont_simulator(
         timekeep=Inject('gearbox/timekeep')):
@@ -33,4 +73,8 @@ def time_search(
 
 shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_S))(step_simulator)
 shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_C))(cont_simulator)
+shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_P))(pause_simulator)
+shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_N))(run_steps)
+shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_X))(clear_breakpoints)
+shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_R))(restore_simulator)
 shortcut(None, (Qt.Key_Space, Qt.Key_S, Qt.Key_Colon))(time_search)
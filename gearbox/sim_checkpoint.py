@@ -0,0 +1,167 @@
+import os
+import struct
+from typing import NamedTuple
+
+from pygears.conf import reg
+
+from .breakpoints import Breakpoint, TimestepBreakpoint
+from .node_model import find_cosim_modules
+
+_TARGET = struct.Struct('q')
+_DISCARD = -1
+
+
+class Checkpoint(NamedTuple):
+    timestep: int
+    pid: int
+    fd: int
+
+
+def trace_file():
+    """Returns the VCD file written by the simulator, or None if there is no
+    trace. Raises ValueError if the trace cannot be rewound."""
+
+    try:
+        vcd = reg['VCD']
+    except KeyError:
+        return None
+
+    if vcd.shmidcat or not os.path.isfile(vcd.trace_fn):
+        raise ValueError('VCD trace is not a regular file')
+
+    return vcd.vcd_file
+
+
+def checkpoints_supported():
+    # The state of the cosimulated modules lives in other processes, which
+    # are not forked with the simulator
+    if find_cosim_modules():
+        return False
+
+    try:
+        trace_file()
+    except ValueError:
+        return False
+
+    return True
+
+
+class CheckpointTimer(Breakpoint):
+    """Takes a checkpoint every interval timesteps, without ever breaking the
+    simulation."""
+
+    def __init__(self, checkpoints, interval):
+        super().__init__()
+        self.checkpoints = checkpoints
+        self.interval = interval
+
+    def arm(self, engine, timestep):
+        super().arm(engine, timestep)
+        engine.schedule(timestep + self.interval, self)
+
+    def expired(self, timestep, tag):
+        self.engine.schedule(timestep + self.interval, self)
+        self.checkpoints.take(timestep, self.engine)
+        return False
+
+
+class Checkpoints:
+    """Snapshots of the simulator process taken by forking it. Each snapshot
+    waits blocked on its pipe, until it is either told to resume the
+    simulation, in place of the simulator process, or to exit.
+
+    The trace written by the snapshot after it resumes is written over the
+    trace written after the snapshot was taken, which is the same as long as
+    the simulation is deterministic.
+    """
+
+    def __init__(self, interval, limit):
+        self.interval = interval
+        self.limit = limit
+        self.items = []
+
+        # Called with the target timestep in the checkpoint that was resumed
+        self.on_resume = None
+
+    def timer(self):
+        if not self.interval or not checkpoints_supported():
+            return None
+
+        return CheckpointTimer(self, self.interval)
+
+    def take(self, timestep, engine):
+        vcd_file = trace_file()
+        if vcd_file is not None:
+            vcd_file.flush()
+            trace_pos = vcd_file.tell()
+
+        r, w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(w)
+            target = self.wait(r)
+
+            if vcd_file is not None:
+                vcd_file.seek(trace_pos)
+
+            if self.on_resume is not None:
+                self.on_resume(target)
+
+            # Scheduled timesteps that are already reached are checked for
+            # before returning to the simulation
+            engine.schedule(target, TimestepBreakpoint(target))
+            return
+
+        os.close(r)
+        self.items.append(Checkpoint(timestep, pid, w))
+        if len(self.items) > self.limit:
+            self.discard(self.items.pop(0))
+
+    def wait(self, fd):
+        try:
+            data = os.read(fd, _TARGET.size)
+        except OSError:
+            data = b''
+
+        os.close(fd)
+
+        # Simulator process is gone without restoring this checkpoint
+        if len(data) != _TARGET.size:
+            os._exit(0)
+
+        target, = _TARGET.unpack(data)
+        if target == _DISCARD:
+            os._exit(0)
+
+        return target
+
+    def discard(self, cp):
+        try:
+            os.write(cp.fd, _TARGET.pack(_DISCARD))
+            os.close(cp.fd)
+            os.waitpid(cp.pid, 0)
+        except (OSError, ChildProcessError):
+            pass
+
+    def restore(self, timestep):
+        """Resumes the latest checkpoint taken before the timestep, which runs
+        the simulation up to the timestep, and exits the current simulator
+        process. Returns False if there is no such checkpoint."""
+
+        for i in reversed(range(len(self.items))):
+            if self.items[i].timestep <= timestep:
+                break
+        else:
+            return False
+
+        try:
+            os.write(self.items[i].fd, _TARGET.pack(timestep))
+        except OSError:
+            # Checkpoint process is gone
+            self.items.pop(i)
+            return False
+
+        for cp in self.items[i + 1:]:
+            self.discard(cp)
+
+        os._exit(0)
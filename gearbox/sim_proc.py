@@ -0,0 +1,378 @@
+import multiprocessing
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+from PySide2 import QtCore
+from pygears.conf import Inject, inject, reg
+from pygears.conf.trace import log_exception
+from pygears.sim import SimFinish, sim
+from pygears.sim import timestep as sim_timestep
+from pygears.sim.extens.sim_extend import SimExtend
+from pygears.sim.modules import SimVerilated
+
+from .breakpoints import Breakpoint, BreakpointEngine, TimestepBreakpoint
+from .node_model import find_cosim_modules
+from .sim_checkpoint import Checkpoints
+
+# Published by the simulator process while it has not simulated any timestep
+NO_TIMESTEP = -1
+
+# Seconds to wait for the simulator process to report whether a checkpoint
+# was restored
+RESTORE_TIMEOUT = 5
+
+
+def trace_info():
+    try:
+        vcd = reg['VCD']
+    except KeyError:
+        return None
+
+    info = {'trace_fn': vcd.trace_fn}
+    if hasattr(vcd, 'shmid'):
+        info['shmid'] = vcd.shmid
+
+    return info
+
+
+class SimWorker(SimExtend):
+    """Simulator extension run in the simulator process. It is the
+    counterpart of Gearbox, which breaks the simulation by talking to the
+    GUI over the connection instead of running a Qt event loop.
+    """
+
+    def __init__(self, conn, shared_timestep, live, refresh_interval, checkpoints):
+        self.conn = conn
+        self.shared_timestep = shared_timestep
+        self.live = live
+        self.refresh_interval = refresh_interval
+        self.refresh_time = 0
+        self.breakpoints = BreakpointEngine()
+        self.checkpoints = checkpoints
+        self.checkpoints.on_resume = self.resumed
+        self.done = False
+
+    def __call__(self):
+        SimExtend.__init__(self)
+        return self
+
+    def publish(self):
+        timestep = sim_timestep()
+        self.shared_timestep.value = NO_TIMESTEP if timestep is None else timestep
+
+    def command(self, name, *args):
+        """Executes the command received from the GUI, and returns whether the
+        simulation should continue."""
+
+        if name == 'cont':
+            return True
+
+        if name == 'close':
+            self.done = True
+            return True
+
+        if name == 'restore':
+            # Does not return if the checkpoint is resumed, in which case the
+            # checkpoint reports it instead
+            if not self.checkpoints.restore(*args):
+                self.conn.send(('restored', False))
+
+            return False
+
+        getattr(self.breakpoints, name)(*args)
+
+        if name in ('clear', 'replace'):
+            self.start_checkpoints()
+
+        return False
+
+    def start_checkpoints(self):
+        timer = self.checkpoints.timer()
+        if timer is not None:
+            self.breakpoints.add(timer)
+
+    def resumed(self, target):
+        """Called in the checkpoint resumed in place of the simulator process.
+        The breakpoints it was forked with are replaced by the ones set in the
+        GUI by now, before the simulation goes on."""
+
+        self.conn.send(('restored', True))
+
+        while True:
+            try:
+                name, *args = self.conn.recv()
+            except EOFError:
+                name, args = 'close', []
+
+            if name == 'replace':
+                # Timesteps before the checkpoint are never reached again
+                timestep = sim_timestep()
+                args = [[
+                    bp for bp in args[0]
+                    if not (isinstance(bp, TimestepBreakpoint) and bp.timestep < timestep)
+                ]]
+
+            self.command(name, *args)
+
+            if name in ('replace', 'close'):
+                break
+
+        # Breakpoints are armed right away, since the simulation is resumed
+        # in the middle of checking them
+        self.breakpoints.arm(sim_timestep())
+
+    def handle_event(self, name, *args):
+        if self.done:
+            return
+
+        self.publish()
+        self.conn.send((name, ) + args)
+
+        while True:
+            try:
+                msg = self.conn.recv()
+            except EOFError:
+                # The GUI is gone
+                msg = ('close', )
+
+            if self.command(*msg):
+                break
+
+        self.refresh_time = time.monotonic()
+
+        if self.done and not name == 'after_cleanup':
+            raise SimFinish
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self.refresh_time < self.refresh_interval:
+            return
+
+        self.refresh_time = now
+        self.publish()
+
+        # Breakpoints and pause requests sent while the simulation runs are
+        # picked up here
+        while self.conn.poll():
+            self.command(*self.conn.recv())
+
+        self.conn.send(('refresh', ))
+
+    def before_setup(self, sim):
+        if self.live:
+            for m in find_cosim_modules():
+                if isinstance(m, SimVerilated):
+                    m.vcd_fifo = True
+                    m.shmidcat = True
+
+    def before_run(self, sim):
+        e = sim.events['after_timestep']
+        i = e.index(self.after_timestep)
+        del e[i]
+        e.append(self.after_timestep)
+
+        self.start_checkpoints()
+        self.handle_event('before_run', trace_info())
+
+    def after_timestep(self, sim, timestep):
+        bps = self.breakpoints
+        if timestep >= bps.due and bps.check(timestep):
+            self.handle_event('after_timestep')
+        elif self.done:
+            raise SimFinish
+        else:
+            self.refresh()
+
+        return True
+
+    def after_cleanup(self, sim):
+        self.handle_event('after_cleanup')
+
+
+def run_worker(conn, shared_timestep, live, refresh_interval, checkpoints):
+    try:
+        sim(extens=[SimWorker(conn, shared_timestep, live, refresh_interval, checkpoints)],
+            check_activity=False)
+    except Exception as e:
+        log_exception(e)
+        conn.send(('exception', ))
+
+    conn.close()
+
+
+class RemoteBreakpoints:
+    """Stands in for the breakpoint engine of the simulator process, and
+    forwards the breakpoints to it."""
+
+    def __init__(self, proc):
+        self.proc = proc
+
+        # Breakpoints set in the GUI, sent anew to the checkpoints resumed
+        self.items = {}
+
+    def add(self, bp):
+        if not isinstance(bp, Breakpoint):
+            raise TypeError(
+                'Only typed breakpoints can be set when simulating in a separate process')
+
+        self.items[bp.key] = bp
+        self.proc.send('add', bp)
+
+    def pause(self):
+        self.proc.send('pause')
+
+    def clear(self):
+        self.items.clear()
+        self.proc.send('clear')
+
+    def remove(self, bp):
+        self.items.pop(bp.key, None)
+        self.proc.send('remove', bp)
+
+    def replace(self):
+        self.proc.send('replace', list(self.items.values()))
+
+
+class SimProcess(QtCore.QObject):
+    """Runs the simulation in a separate process, forked after the design was
+    elaborated, so that it does not share the GIL with the GUI. It has the
+    same interface towards PyGearsClient as Gearbox: the events of the
+    simulator process are received on a separate thread and emitted as
+    sim_event.
+    """
+
+    sim_event = QtCore.Signal(str)
+
+    @inject
+    def __init__(self,
+                 live=True,
+                 reload=True,
+                 refresh_interval=Inject('gearbox/sim_refresh_interval'),
+                 checkpoint_interval=Inject('gearbox/sim_checkpoint_interval'),
+                 checkpoint_limit=Inject('gearbox/sim_checkpoint_limit')):
+
+        super().__init__()
+
+        reg['sim/gearbox'] = self
+
+        self.live = live
+        self.reload = reload
+        self.running = False
+        self._done = False
+
+        # The simulator process might be replaced by its checkpoints, so
+        # whether the simulation is still going is told by the events
+        self.alive = True
+        self.breakpoints = RemoteBreakpoints(self)
+        self.send_lock = threading.Lock()
+        self.restored = queue.Queue()
+
+        # The simulator process needs a copy of the elaborated design, which
+        # cannot be pickled, hence it is forked instead of being started by
+        # 'spawn' or 'forkserver'. Forking the threaded GUI process is safe
+        # here, since the simulator process only runs the simulator: it never
+        # calls into Qt, nor touches the objects of the GUI threads, whose
+        # locks might have been held at the time of the fork. Locks of the
+        # interpreter itself are reinitialized after the fork by Python.
+        ctx = multiprocessing.get_context('fork')
+        self.shared_timestep = ctx.RawValue('q', NO_TIMESTEP)
+        self.conn, child_conn = ctx.Pipe()
+        checkpoints = Checkpoints(checkpoint_interval, checkpoint_limit)
+        self.proc = ctx.Process(
+            target=run_worker,
+            args=(child_conn, self.shared_timestep, live, refresh_interval, checkpoints),
+            daemon=True)
+        self.proc.start()
+        child_conn.close()
+
+        self.thrd = QtCore.QThread()
+        self.moveToThread(self.thrd)
+        self.thrd.started.connect(self.run)
+        self.thrd.start()
+
+    def send(self, *msg):
+        with self.send_lock:
+            try:
+                self.conn.send(msg)
+            except (OSError, EOFError):
+                pass
+
+    @property
+    def done(self):
+        return self._done
+
+    @done.setter
+    def done(self, val):
+        self._done = val
+        if val:
+            self.send('close')
+
+    @property
+    def timestep(self):
+        timestep = self.shared_timestep.value
+        if timestep == NO_TIMESTEP:
+            return None
+
+        return timestep
+
+    def cont(self):
+        self.running = True
+        self.send('cont')
+
+    def restore(self, timestep):
+        """Restores the simulation at the timestep from a checkpoint, and
+        returns whether there was a checkpoint to restore it from."""
+
+        if not self.alive:
+            return False
+
+        # Drops the result that arrived after an earlier restore timed out
+        while not self.restored.empty():
+            self.restored.get_nowait()
+
+        self.send('restore', timestep)
+
+        try:
+            restored = self.restored.get(timeout=RESTORE_TIMEOUT)
+        except queue.Empty:
+            restored = False
+
+        if restored:
+            self.running = True
+
+        return restored
+
+    def run(self):
+        while True:
+            try:
+                name, *args = self.conn.recv()
+            except (OSError, EOFError):
+                break
+
+            if name == 'restored':
+                if args[0]:
+                    self.breakpoints.replace()
+
+                self.restored.put(args[0])
+                continue
+
+            if name in ('after_cleanup', 'exception'):
+                self.alive = False
+
+            if name == 'before_run' and args[0] is not None:
+                # The waveform viewer is attached to the trace written by the
+                # simulator process
+                reg['VCD'] = SimpleNamespace(**args[0])
+
+            self.running = (name == 'refresh')
+            self.sim_event.emit(name)
+
+        self.alive = False
+        self.running = False
+
+        # Only reaps the original process if it has exited. A checkpoint that
+        # replaced it is not a child of this process and is not waited for
+        self.proc.join(timeout=0)
+        self.thrd.quit()
@@ -0,0 +1,436 @@
+from typing import NamedTuple
+
+import numpy as np
+from PySide2 import QtCore, QtWidgets
+from pygears.conf import Inject, MayInject, inject, reg
+
+from .html_utils import tabulate, fontify
+from .graph import expand_to
+from .layout import Buffer, LayoutPlugin, show_buffer
+from .pipe_status import STATUS_ACTIVE
+
+
+class Stall(NamedTuple):
+    start: int
+    end: int
+    nodes: tuple
+    pipes: tuple
+    circular: bool
+
+    @property
+    def cycles(self):
+        return self.end - self.start
+
+
+def pipe_producer(pipe):
+    gear = pipe.rtl.producer.gear
+    if gear is pipe.parent.rtl:
+        return pipe.parent
+
+    return pipe.parent.rtl_map[gear]
+
+
+def _vertex(node, side):
+    # Hierarchical nodes are split into their input and output sides, so that
+    # the pipes passing through them do not form false loops
+    return (node, side) if node.hierarchical else node
+
+
+def _vertex_node(v):
+    return v[0] if isinstance(v, tuple) else v
+
+
+class StallGraph:
+    """Structure of the traced part of the graph, indexed by the rows of the
+    pipe status engine. It holds only the model objects and is not modified
+    after creation, so it can be handed to the scanning thread.
+    """
+
+    def __init__(self, engine):
+        rows = engine.rows
+
+        self.pipes = {row: pipe for pipe, row in rows.items()}
+        self.edges = {}
+        self.waiters = {}
+        nodes = {}
+
+        for pipe, row in rows.items():
+            producer = pipe_producer(pipe)
+            consumer = pipe.consumer
+            nodes.setdefault(producer, None)
+            nodes.setdefault(consumer, None)
+
+            src = _vertex(producer, 'in' if pipe in producer.input_int_pipes else 'out')
+            dst = _vertex(consumer, 'out' if pipe in consumer.output_int_pipes else 'in')
+            self.edges[row] = (src, dst)
+            self.waiters.setdefault(consumer, []).append((row, producer))
+
+        self.nodes = []
+        for node in nodes:
+            in_rows = [rows[p] for p in node.input_ext_pipes if p in rows]
+            out_rows = [rows[p] for p in node.output_ext_pipes if p in rows]
+            if in_rows:
+                self.nodes.append((node, in_rows, out_rows))
+
+
+class RunTracker:
+    """Tracks the intervals in which the rows of a boolean matrix stay set,
+    across consecutive column chunks.
+    """
+
+    def __init__(self, num, min_len):
+        self.min_len = min_len
+        self.open = np.full(num, -1, dtype=np.int64)
+        self.runs = {}
+
+    def feed(self, mask, offset):
+        width = mask.shape[1]
+
+        # Runs carried over from the previous chunk, that ended at its border
+        for i in np.nonzero((self.open >= 0) & ~mask[:, 0])[0]:
+            self.close(i, offset)
+
+        padded = np.zeros((mask.shape[0], width + 2), dtype=np.int8)
+        padded[:, 1:-1] = mask
+        edges = np.diff(padded, axis=1)
+
+        # Each row is padded with zeros on both sides, so in row-major order
+        # every rise is followed by its matching fall
+        rows, rise = np.nonzero(edges > 0)
+        fall = np.nonzero(edges < 0)[1]
+
+        starts = offset + rise
+        cont = (rise == 0) & (self.open[rows] >= 0)
+        starts[cont] = self.open[rows[cont]]
+
+        ended = fall < width
+        self.open[:] = -1
+        self.open[rows[~ended]] = starts[~ended]
+
+        long = ended & (offset + fall - starts >= self.min_len)
+        for i, start, end in zip(rows[long], starts[long], offset + fall[long]):
+            self.runs.setdefault(int(i), []).append((int(start), int(end)))
+
+    def close(self, i, end):
+        start = self.open[i]
+        self.open[i] = -1
+        if end - start >= self.min_len:
+            self.runs.setdefault(int(i), []).append((int(start), int(end)))
+
+    def finish(self, end):
+        for i in np.nonzero(self.open >= 0)[0]:
+            self.close(i, end)
+
+        return self.runs
+
+
+def scan_runs(engine, graph, min_cycles, end, chunk=4096, cancelled=lambda: False):
+    """Scans the timesteps up to end, and returns the intervals longer than
+    min_cycles in which the nodes were stuck and in which the pipes were
+    waiting.
+    """
+
+    node_runs = RunTracker(len(graph.nodes), min_cycles)
+    pipe_runs = RunTracker(len(engine.pipes), min_cycles)
+
+    for start in range(0, end, chunk):
+        if cancelled():
+            return None, None
+
+        codes = engine.over(np.arange(start, min(end, start + chunk)) * 10)
+        waiting = codes == STATUS_ACTIVE
+        valid = (codes & 1).astype(bool)
+
+        stuck = np.zeros((len(graph.nodes), codes.shape[1]), dtype=bool)
+        for i, (_, in_rows, out_rows) in enumerate(graph.nodes):
+            stuck[i] = waiting[in_rows].any(axis=0) & ~valid[out_rows].any(axis=0)
+
+        node_runs.feed(stuck, start)
+        pipe_runs.feed(waiting, start)
+
+    return node_runs.finish(end), pipe_runs.finish(end)
+
+
+def _run_at(runs, start, end):
+    for a, b in runs:
+        if a <= start and b >= end:
+            return a, b
+
+
+def wait_chain(graph, pipe_runs, node, start, end):
+    """Follows the pipes waiting on the node during the whole interval
+    upstream, back to where the backpressure originates.
+    """
+
+    chain = []
+    visited = {node}
+    front = [node]
+    while front:
+        cur = front.pop()
+        for row, producer in graph.waiters.get(cur, []):
+            if row not in pipe_runs or _run_at(pipe_runs[row], start, end) is None:
+                continue
+
+            chain.append(graph.pipes[row])
+            if producer not in visited:
+                visited.add(producer)
+                front.append(producer)
+
+    return tuple(chain)
+
+
+def circular_waits(graph, pipe_runs, min_cycles):
+    """Sweeps through the pipe waiting intervals and reports each loop of
+    pipes in which every pipe waited for the next for at least min_cycles.
+    """
+
+    events = []
+    for row, runs in pipe_runs.items():
+        for a, b in runs:
+            events.append((b, 0, row, a, b))
+            events.append((a + min_cycles - 1, 1, row, a, b))
+
+    events.sort()
+
+    out_edges = {}
+    cur_runs = {}
+    found = {}
+
+    def path(src, dst):
+        stack = [(src, ())]
+        visited = {src}
+        while stack:
+            v, rows = stack.pop()
+            if v == dst:
+                return rows
+
+            for row, nxt in out_edges.get(v, {}).items():
+                if nxt not in visited:
+                    visited.add(nxt)
+                    stack.append((nxt, rows + (row, )))
+
+    for t, add, row, a, b in events:
+        src, dst = graph.edges[row]
+        if not add:
+            if cur_runs.get(row) == (a, b):
+                del out_edges[src][row]
+                del cur_runs[row]
+            continue
+
+        out_edges.setdefault(src, {})[row] = dst
+        cur_runs[row] = (a, b)
+
+        loop = path(dst, src)
+        if loop is None:
+            continue
+
+        rows = (row, ) + loop
+        start = max(cur_runs[r][0] for r in rows)
+        end = min(cur_runs[r][1] for r in rows)
+        key = (frozenset(rows), start)
+        if key not in found:
+            nodes = tuple({_vertex_node(graph.edges[r][0]): None for r in rows})
+            found[key] = Stall(start, end, nodes, tuple(graph.pipes[r] for r in rows), True)
+
+    return list(found.values())
+
+
+def find_stalls(engine, graph, min_cycles, end, cancelled=lambda: False):
+    node_runs, pipe_runs = scan_runs(engine, graph, min_cycles, end, cancelled=cancelled)
+    if node_runs is None:
+        return None
+
+    stalls = circular_waits(graph, pipe_runs, min_cycles)
+
+    for i, runs in node_runs.items():
+        node = graph.nodes[i][0]
+        for start, stop in runs:
+            chain = wait_chain(graph, pipe_runs, node, start, start + min_cycles)
+            stalls.append(Stall(start, stop, (node, ), chain, False))
+
+    stalls.sort(key=lambda s: (s.start, not s.circular, -s.cycles))
+    return stalls
+
+
+class StallScan:
+    def __init__(self, jobs, min_cycles, end):
+        self.jobs = jobs
+        self.min_cycles = min_cycles
+        self.end = end
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        """Returns the stalls found, or None if the scan was cancelled."""
+        stalls = []
+        for engine, graph in self.jobs:
+            res = find_stalls(engine, graph, self.min_cycles, self.end, lambda: self.cancelled)
+            if res is None:
+                return None
+
+            stalls.extend(res)
+
+        stalls.sort(key=lambda s: (s.start, not s.circular, -s.cycles))
+        return stalls
+
+
+class StallScanner(QtCore.QObject):
+    """Runs the stall scans off the GUI thread, one after another"""
+
+    request = QtCore.Signal(object)
+    done = QtCore.Signal(object, object)
+
+    def __init__(self):
+        super().__init__()
+
+        self.thrd = QtCore.QThread()
+        self.moveToThread(self.thrd)
+        reg['gearbox/main/threads'].add(self.thrd)
+        QtWidgets.QApplication.instance().aboutToQuit.connect(self.thrd.quit)
+        self.request.connect(self.run)
+        self.thrd.start()
+
+    def run(self, scan):
+        if not scan.cancelled:
+            self.done.emit(scan, scan.run())
+
+
+@inject
+def stall_scanner(scanner=Inject('gearbox/stalls/scanner')):
+    if scanner is None:
+        scanner = StallScanner()
+        reg['gearbox/stalls/scanner'] = scanner
+
+    return scanner
+
+
+class Stalls(QtWidgets.QTextBrowser):
+    def __init__(self):
+        super().__init__()
+        self.document().setDefaultStyleSheet(
+            QtWidgets.QApplication.instance().styleSheet())
+        self.setOpenLinks(False)
+        self.anchorClicked.connect(self.select)
+        self.stalls = []
+        self.scan = None
+        self.scanner_connected = False
+        self.min_cycles = 0
+
+    @inject
+    def start_scan(self,
+                   gtkwave=MayInject('gearbox/gtkwave/inst'),
+                   timekeep=Inject('gearbox/timekeep'),
+                   min_cycles=Inject('gearbox/stalls/min_cycles')):
+
+        self.cancel()
+
+        end = (timekeep.max_timestep or 0) + 1
+
+        jobs = []
+        if gtkwave is not None:
+            for intf in gtkwave.graph_intfs:
+                if intf.vcd_index is None:
+                    continue
+
+                intf.tail_trace()
+                engine = intf.status_engine
+                # Graph structure is collected here, since the models can only
+                # be safely traversed from the GUI thread
+                jobs.append((engine.snapshot(), StallGraph(engine)))
+
+        self.min_cycles = min_cycles
+        self.setHtml(fontify(f'Scanning timesteps [0, {end}) for stalls...', bold=True))
+
+        self.scan = StallScan(jobs, min_cycles, end)
+
+        scanner = stall_scanner()
+        if not self.scanner_connected:
+            scanner.done.connect(self.scan_done)
+            self.scanner_connected = True
+
+        scanner.request.emit(self.scan)
+
+    def cancel(self):
+        if self.scan is not None:
+            self.scan.cancel()
+            self.scan = None
+
+    def scan_done(self, scan, stalls):
+        if scan is self.scan and stalls is not None:
+            self.scan = None
+            self.show_stalls(stalls)
+
+    def show_stalls(self, stalls):
+        self.stalls = stalls
+
+        header = ['Start', 'Cycles', 'Kind', 'Nodes', 'Waiting pipes']
+        table = [[('', fontify(h, bold=True)) for h in header]]
+        for i, s in enumerate(stalls):
+            kind = fontify('deadlock', color='@text-color-error') if s.circular else 'stuck'
+            table.append([
+                ('align="right"', f'<a href="stall:{i}">{s.start}</a>'),
+                ('align="right"', s.cycles),
+                ('', kind),
+                ('', '<br/>'.join(n.name for n in s.nodes)),
+                ('', len(s.pipes)),
+            ])
+
+        self.setHtml(
+            fontify(f'Found {len(stalls)} stalls', bold=True) +
+            tabulate(table, 'cellpadding="4"'))
+
+    @inject
+    def select(self, url, timekeep=Inject('gearbox/timekeep'), graph=Inject('gearbox/graph')):
+        if url.scheme() != 'stall':
+            return
+
+        stall = self.stalls[int(url.path())]
+        timekeep.timestep = min(stall.start + self.min_cycles, stall.end - 1)
+
+        for node in stall.nodes:
+            expand_to(node)
+
+        graph.select(stall.nodes[0].view)
+        for node in stall.nodes[1:]:
+            node.view.setSelected(True)
+
+        for pipe in stall.pipes:
+            if pipe.view is not None and pipe.view.isVisible():
+                pipe.view.setSelected(True)
+
+    def delete(self):
+        self.cancel()
+        if self.scanner_connected:
+            stall_scanner().done.disconnect(self.scan_done)
+
+
+class StallsBuffer(Buffer):
+    def delete(self):
+        super().delete()
+        self.view.delete()
+
+    @property
+    def domain(self):
+        return 'stalls'
+
+
+@inject
+def stalls(layout=Inject('gearbox/layout')):
+    for b in layout.buffers:
+        if isinstance(b, StallsBuffer):
+            break
+    else:
+        b = StallsBuffer(Stalls(), 'stalls')
+
+    b.view.start_scan()
+    show_buffer(b)
+    return b
+
+
+class StallScanPlugin(LayoutPlugin):
+    @classmethod
+    def bind(cls):
+        reg['gearbox/stalls/scanner'] = None
+        reg.confdef('gearbox/stalls/min_cycles', default=100)
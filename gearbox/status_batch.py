@@ -0,0 +1,34 @@
+class StatusBatch:
+    """Collects the status changes of the graph views, e.g. for a single
+    timestep, and applies them at once. Only the views whose colour actually
+    changed are repainted, with a single invalidation of the scene.
+
+    Can be used as a context manager, which commits the batch on exit.
+    """
+
+    def __init__(self):
+        self.changes = {}
+
+    def add(self, view, status):
+        self.changes[view] = status
+
+    def commit(self):
+        changed = [view for view, status in self.changes.items() if view.apply_status(status)]
+        self.changes = {}
+
+        if not changed:
+            return
+
+        scene = changed[0].scene()
+        if scene is None:
+            for view in changed:
+                view.update()
+        else:
+            scene.update_items(changed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
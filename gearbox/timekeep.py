@@ -1,8 +1,8 @@
 from functools import partial
 from PySide2 import QtCore
-from pygears.sim import timestep as sim_timestep
 from pygears.conf import inject, Inject, inject_async, reg
 from .dbg import dbg_connect
+from .timestep_bus import TimestepBus
 
 
 @inject
@@ -16,13 +16,23 @@ def max_timestep(timekeep=Inject('gearbox/timekeep')):
 
 
 @inject
-def timetep_event_register_connect(slot, timekeep=Inject('gearbox/timekeep')):
+def timetep_event_register_connect(slot, priority=0, cost=0, timekeep=Inject('gearbox/timekeep')):
     # dbg_connect(timekeep.timestep_changed, slot)
-    timekeep.timestep_changed.connect(slot)
+    timekeep.bus.subscribe(slot, priority, cost)
 
 
-def timestep_event_register(slot):
-    inject_async(partial(timetep_event_register_connect, slot=slot))
+def timestep_event_register(slot, priority=0, cost=0):
+    """Subscribes the slot to the timestep changes, which are delivered to it
+    throttled and coalesced by the timestep bus. Subscribers with higher
+    priority are served first, and cost is the expected time in seconds
+    the slot takes to run.
+    """
+    inject_async(partial(timetep_event_register_connect, slot=slot, priority=priority, cost=cost))
+
+
+@inject
+def timestep_event_unregister(slot, timekeep=Inject('gearbox/timekeep')):
+    timekeep.bus.unsubscribe(slot)
 
 
 def timekeep(sim_bridge=Inject('gearbox/sim_bridge')):
@@ -33,15 +43,16 @@ class TimeKeep(QtCore.QObject):
     timestep_changed = QtCore.Signal(int)
 
     @inject
-    def __init__(self,
-                 cont_refresh_step=100,
-                 sim_bridge=Inject('gearbox/sim_bridge')):
+    def __init__(self, sim_bridge=Inject('gearbox/sim_bridge')):
         super().__init__()
         self._timestep = None
         self._time_target = None
-        self._cont_refresh_step = cont_refresh_step
+        self._run_to = None
+        self.bus = TimestepBus()
+        self.timestep_changed.connect(self.bus.post)
         reg['gearbox/timestep'] = self.max_timestep
         sim_bridge.after_timestep.connect(self.sim_break)
+        sim_bridge.refresh.connect(self.sim_break)
         sim_bridge.after_cleanup.connect(self.sim_break)
         sim_bridge.model_closed.connect(self.model_closed)
         sim_bridge.script_loaded.connect(self.model_loaded)
@@ -49,11 +60,13 @@ class TimeKeep(QtCore.QObject):
     def model_loaded(self):
         self._timestep = None
         self._time_target = None
+        self._run_to = None
         self.timestep_changed.emit(self._timestep)
 
     def model_closed(self):
         self._timestep = None
         self._time_target = None
+        self._run_to = None
 
     def sim_break(self):
         self.timestep = self.max_timestep
@@ -62,25 +75,19 @@ class TimeKeep(QtCore.QObject):
     def timestep(self):
         return self._timestep
 
-    def break_on_timestep(self):
-        if self._timestep is None:
-            self._timestep = 0
-
-        if self.max_timestep >= self._timestep + self._cont_refresh_step:
-            self.timestep = self.max_timestep
-
-        if self.max_timestep == self._time_target:
-            return True, False
-        else:
-            return False, True
-
     @timestep.setter
     @inject
     def timestep(self, val, sim_bridge=Inject('gearbox/sim_bridge')):
         if (self.max_timestep is None) or (val > self.max_timestep):
             self._time_target = val
             self._timestep = self.max_timestep
-            sim_bridge.breakpoint(self.break_on_timestep)
+
+            # Only the latest seek target is kept, so that the previous ones
+            # do not break the simulation later on
+            if self._run_to is not None:
+                sim_bridge.remove_breakpoint(self._run_to)
+
+            self._run_to = sim_bridge.break_at(val)
             if not sim_bridge.running:
                 sim_bridge.cont()
         else:
@@ -91,5 +98,6 @@ class TimeKeep(QtCore.QObject):
                 self.timestep_changed.emit(self._timestep)
 
     @property
-    def max_timestep(self):
-        return sim_timestep()
+    @inject
+    def max_timestep(self, sim_bridge=Inject('gearbox/sim_bridge')):
+        return sim_bridge.timestep
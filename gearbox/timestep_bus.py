@@ -0,0 +1,155 @@
+import math
+import time
+
+from PySide2 import QtCore
+from pygears.conf import Inject, PluginBase, inject, reg
+
+from .description import describe_text
+from .html_utils import tabulate, fontify
+
+# Weight of the last measured delivery in the running estimate of its cost
+COST_SMOOTHING = 0.25
+
+
+class TimestepSubscriber:
+    def __init__(self, slot, priority, cost, rate):
+        self.slot = slot
+        self.priority = priority
+        self.cost = cost
+        self.rate = rate
+        self.version = 0
+        self.last_time = -math.inf
+        self.delivered = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    @property
+    def name(self):
+        func = getattr(self.slot, '__func__', self.slot)
+        return getattr(func, '__qualname__', repr(self.slot))
+
+
+class TimestepBus(QtCore.QObject):
+    """Delivers the timestep changes to the subscribers, each at most rate
+    times per second. The changes posted in between are coalesced into a
+    single delivery of the latest timestep.
+
+    Subscribers are served in the order of their priority. Once the frame
+    budget is spent, the remaining ones are dropped from the frame and
+    served in the next one. The cost declared by a subscriber is its
+    expected delivery time in seconds, which is replaced by the measured
+    one as the deliveries are made.
+    """
+
+    @inject
+    def __init__(self,
+                 max_rate=Inject('gearbox/timestep_bus/max_rate'),
+                 budget=Inject('gearbox/timestep_bus/budget')):
+        super().__init__()
+        self.max_rate = max_rate
+        self.budget = budget
+        self.subscribers = []
+        self.timestep = None
+        self.version = 0
+        self.posted = 0
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.deliver)
+
+    def subscribe(self, slot, priority=0, cost=0, rate=None):
+        if rate is None:
+            rate = self.max_rate
+
+        sub = TimestepSubscriber(slot, priority, cost, min(rate, self.max_rate))
+        sub.version = self.version
+
+        # Subscribers with the same priority are served in subscription order
+        i = 0
+        while i < len(self.subscribers) and self.subscribers[i].priority >= priority:
+            i += 1
+
+        self.subscribers.insert(i, sub)
+
+    def unsubscribe(self, slot):
+        self.subscribers = [s for s in self.subscribers if s.slot != slot]
+
+    def post(self, timestep):
+        self.timestep = timestep
+        self.version += 1
+        self.posted += 1
+
+        if not self.timer.isActive():
+            self.timer.start(0)
+
+    def deliver(self):
+        frame_start = time.monotonic()
+        next_due = math.inf
+        served = False
+        spent = False
+
+        for sub in list(self.subscribers):
+            if sub.version == self.version:
+                continue
+
+            now = time.monotonic()
+            due = sub.last_time + 1 / sub.rate
+            if now < due:
+                next_due = min(next_due, due)
+                continue
+
+            # At least one subscriber is served in each frame, so that an
+            # expensive one is never starved
+            if spent or (served and now + sub.cost - frame_start > self.budget):
+                spent = True
+                sub.dropped += 1
+                next_due = now
+                continue
+
+            sub.coalesced += self.version - sub.version - 1
+            sub.version = self.version
+            sub.last_time = now
+
+            sub.slot(self.timestep)
+
+            elapsed = time.monotonic() - now
+            sub.cost += COST_SMOOTHING * (elapsed - sub.cost)
+            sub.delivered += 1
+            served = True
+
+        if next_due < math.inf:
+            delay = max(0, next_due - time.monotonic())
+            self.timer.start(int(math.ceil(delay * 1000)))
+
+
+@inject
+def timestep_bus_report(timekeep=Inject('gearbox/timekeep')):
+    """Shows how the timestep changes were delivered to each subscriber,
+    for tuning the rates, priorities and the frame budget.
+    """
+
+    bus = timekeep.bus
+
+    header = ['Subscriber', 'Priority', 'Rate', 'Delivered', 'Coalesced', 'Dropped', 'Cost [ms]']
+    table = [[('', fontify(h, bold=True)) for h in header]]
+    for sub in bus.subscribers:
+        table.append([
+            ('', sub.name),
+            ('align="right"', sub.priority),
+            ('align="right"', f'{sub.rate:g}'),
+            ('align="right"', sub.delivered),
+            ('align="right"', sub.coalesced),
+            ('align="right"', sub.dropped),
+            ('align="right"', f'{sub.cost*1000:.2f}'),
+        ])
+
+    describe_text(
+        fontify(f'Timestep bus: {bus.posted} changes posted', bold=True) +
+        tabulate(table, 'cellpadding="4"'))
+
+
+class TimestepBusPlugin(PluginBase):
+    @classmethod
+    def bind(cls):
+        reg.confdef('gearbox/timestep_bus/max_rate', default=30)
+        reg.confdef('gearbox/timestep_bus/budget', default=0.02)
@@ -1,6 +1,8 @@
 from PySide2 import QtCore
 from pygears.conf import Inject, inject
 
+from .timekeep import timestep_event_register, timestep_event_unregister
+
 
 class TimestepModeline(QtCore.QObject):
     def __init__(self, buff):
@@ -12,22 +14,17 @@ class TimestepModeline(QtCore.QObject):
         if self.buff.visible:
             self.configure()
 
-    @inject
-    def configure(self, timekeep=Inject('gearbox/timekeep')):
+    def configure(self):
         # TODO: Investiget why this is needed here
         if self.buff.window is None:
             return
 
         self.buff.window.modeline.add_field('timestep', '')
-        timekeep.timestep_changed.connect(self.update)
+        timestep_event_register(self.update, priority=10)
         self.update()
 
-    @inject
-    def reset(self, timekeep=Inject('gearbox/timekeep')):
-        try:
-            timekeep.timestep_changed.disconnect(self.update)
-        except RuntimeError:
-            pass
+    def reset(self):
+        timestep_event_unregister(self.update)
 
     @inject
     def update(self, timestep=Inject('gearbox/timestep')):
@@ -0,0 +1,184 @@
+import bisect
+import os
+from array import array
+
+
+class VCDSignal:
+    __slots__ = ('times', 'values')
+
+    def __init__(self):
+        self.times = array('Q')
+        self.values = []
+
+    def __len__(self):
+        return len(self.times)
+
+    def append(self, time, val):
+        # Several changes within the same timestamp: only the last one counts
+        if self.times and self.times[-1] == time:
+            self.values[-1] = val
+        else:
+            self.times.append(time)
+            self.values.append(val)
+
+    def value_at(self, time):
+        i = bisect.bisect_right(self.times, time) - 1
+        if i < 0:
+            return None
+
+        return self.values[i]
+
+
+def vcd_var_name(scope, ref, index=None, size=1):
+    # Mimic GTKWave facility naming, so that names match the ones returned by
+    # the 'list_signals' Tcl procedure. GTKWave adds the bit range to the
+    # vectors declared without one
+    name = '.'.join(scope + [ref])
+    if index is not None:
+        name += index
+    elif size > 1:
+        name += f'[{size-1}:0]'
+
+    return name
+
+
+class VCDIndex:
+    """In-memory index of a VCD trace, storing the time sorted list of changes
+    for each signal, so that signal values can be looked up by binary search.
+    """
+
+    signal_cls = VCDSignal
+
+    def __init__(self, trace_fn, load=True):
+        self.trace_fn = trace_fn
+        self.clear()
+        if load:
+            self.reload()
+
+    def clear(self):
+        self.ids = {}
+        self.signals = {}
+        self.time = 0
+        self.offset = 0
+        self._scope = []
+        self._header = []
+        self.header_done = False
+
+    @property
+    def names(self):
+        return self.signals.keys()
+
+    def __contains__(self, name):
+        return name in self.signals
+
+    def __getitem__(self, name):
+        return self.signals[name]
+
+    def value_at(self, name, time):
+        try:
+            return self.signals[name].value_at(time)
+        except KeyError:
+            return None
+
+    def reload(self):
+        """Parses only the part of the trace appended since the last reload and
+        returns it, so that it can be forwarded to other trace consumers.
+        """
+
+        try:
+            size = os.path.getsize(self.trace_fn)
+        except OSError:
+            return ''
+
+        # Trace was rewritten from scratch
+        if size < self.offset:
+            self.clear()
+
+        if size == self.offset:
+            return ''
+
+        with open(self.trace_fn, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(size - self.offset)
+
+        # Last line might still be in the middle of being written
+        end = data.rfind(b'\n') + 1
+        if end == 0:
+            return ''
+
+        self.offset += end
+        data = data[:end].decode()
+
+        for line in data.splitlines():
+            self.parse_line(line)
+
+        return data
+
+    def parse_line(self, line):
+        if not self.header_done:
+            self._header.extend(line.split())
+            if '$end' in self._header:
+                self.parse_header()
+            return
+
+        line = line.strip()
+        if not line:
+            return
+
+        c = line[0]
+        if c == '#':
+            self.time = int(line[1:])
+        elif c in '01xXzZ':
+            self.change(line[1:], c)
+        elif c in 'bBrRsS':
+            val, _, code = line[1:].partition(' ')
+            self.change(code.strip(), val)
+
+        # Other commands ($dumpvars, $end, $comment, ...) carry no value
+        # changes by themselves, so they are skipped
+
+    def change(self, code, val):
+        try:
+            self.ids[code].append(self.time, val)
+        except KeyError:
+            pass
+
+    def parse_header(self):
+        tokens = self._header
+        while '$end' in tokens:
+            end = tokens.index('$end')
+            cmd, args = tokens[0], tokens[1:end]
+            del tokens[:end + 1]
+
+            if cmd == '$scope':
+                self._scope.append(args[1])
+            elif cmd == '$upscope':
+                self._scope.pop()
+            elif cmd == '$var':
+                var_type, size, code, ref = args[:4]
+                index = args[4] if len(args) > 4 else None
+                if var_type in ('real', 'realtime'):
+                    size = 1
+
+                sig = self.ids.setdefault(code, self.signal_cls())
+                self.signals[vcd_var_name(self._scope, ref, index, int(size))] = sig
+            elif cmd == '$enddefinitions':
+                self.header_done = True
+                del tokens[:]
+                return
+
+
+def read_vcd_header(trace_fn):
+    """Parses only the header of the VCD file. Returns the index with all the
+    declared signals but no value changes, or None if the header has not been
+    completely written yet.
+    """
+
+    index = VCDIndex(trace_fn, load=False)
+    with open(trace_fn) as f:
+        for line in f:
+            index.parse_line(line)
+            if index.header_done:
+                return index
+
+    return None
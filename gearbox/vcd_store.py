@@ -0,0 +1,376 @@
+import bisect
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from .vcd_index import VCDIndex
+
+STORE_EXT = '.gbwave'
+STORE_MAGIC = b'GBWAVE\x00\x02'
+
+# magic, names num, signals num, values num, names offset, signals offset,
+# values offset
+STORE_HEADER = struct.Struct('<8sQQQQQQ')
+
+# changes num, timestamps column offset, values column offset
+STORE_SIGNAL = struct.Struct('<QQQ')
+
+# Changes of a signal kept in memory by StoreWriter, before they are spooled
+STORE_SPOOL_CHANGES = 4096
+
+# Number of distinct values interned by StoreWriter
+STORE_INTERN_VALUES = 1 << 16
+
+
+def store_path(trace_fn):
+    return trace_fn + STORE_EXT
+
+
+def store_is_fresh(trace_fn, store_fn=None):
+    if store_fn is None:
+        store_fn = store_path(trace_fn)
+
+    try:
+        return os.path.getmtime(store_fn) >= os.path.getmtime(trace_fn)
+    except OSError:
+        return False
+
+
+def open_trace(trace_fn):
+    """Returns the columnar store of the trace if an up-to-date one exists,
+    otherwise parses the VCD file itself.
+    """
+
+    if store_is_fresh(trace_fn):
+        try:
+            return VCDStore(store_path(trace_fn))
+        except ValueError:
+            # Written by an incompatible version, will be rewritten
+            pass
+
+    return VCDIndex(trace_fn)
+
+
+def _align(f):
+    pad = -f.tell() % 8
+    f.write(b'\x00' * pad)
+
+
+def _write_str_table(f, strings):
+    blobs = [s.encode() for s in strings]
+    offsets = array('Q', [0])
+    for b in blobs:
+        offsets.append(offsets[-1] + len(b))
+
+    offsets.tofile(f)
+    f.write(b''.join(blobs))
+    _align(f)
+
+
+class SpoolSignal:
+    """Signal changes collected by StoreWriter. Only the latest changes are
+    kept in memory, the rest are spooled in chunks."""
+
+    __slots__ = ('times', 'value_ids', 'chunks', 'num')
+
+    def __init__(self):
+        self.times = array('Q')
+        self.value_ids = array('I')
+        self.chunks = []
+        self.num = 0
+
+    def __len__(self):
+        return self.num
+
+
+def _copy(src, offset, size, dst, block=1 << 20):
+    src.seek(offset)
+    while size:
+        data = src.read(min(size, block))
+        dst.write(data)
+        size -= len(data)
+
+
+class StoreWriter(VCDIndex):
+    """Converts a VCD trace into the columnar store while parsing it. The
+    changes of each signal are spooled to a temporary file in chunks, which
+    are gathered into the signal columns once the whole trace is parsed, so
+    that the memory used does not depend on the size of the trace.
+    """
+
+    signal_cls = SpoolSignal
+
+    def __init__(self, trace_fn, store_fn):
+        self.store_fn = store_fn
+        super().__init__(trace_fn, load=False)
+
+        tmp_dir = os.path.dirname(store_fn) or None
+        self.spool = tempfile.TemporaryFile(dir=tmp_dir)
+        self.spool_size = 0
+
+        # Value table is spooled as well, as the string table written to the
+        # store: the end offsets of the values, and their contents
+        self.value_offsets = tempfile.TemporaryFile(dir=tmp_dir)
+        self.value_blob = tempfile.TemporaryFile(dir=tmp_dir)
+        array('Q', [0]).tofile(self.value_offsets)
+        self.values_num = 0
+        self.values_size = 0
+
+        # Single bit values get fixed IDs, so that they can be decoded without
+        # the value table
+        self.values = {}
+        for v in ('0', '1'):
+            self.value_id(v)
+
+    def value_id(self, val):
+        try:
+            return self.values[val]
+        except KeyError:
+            pass
+
+        vid = self.values_num
+        blob = val.encode()
+        self.value_blob.write(blob)
+        self.values_size += len(blob)
+        array('Q', [self.values_size]).tofile(self.value_offsets)
+        self.values_num += 1
+
+        # Values beyond the interned ones are stored as they come
+        if len(self.values) < STORE_INTERN_VALUES:
+            self.values[val] = vid
+
+        return vid
+
+    def change(self, code, val):
+        try:
+            sig = self.ids[code]
+        except KeyError:
+            return
+
+        vid = self.value_id(val)
+
+        # Several changes within the same timestamp: only the last one counts.
+        # The last change is never spooled, so that it can be overwritten
+        if sig.times and sig.times[-1] == self.time:
+            sig.value_ids[-1] = vid
+            return
+
+        sig.times.append(self.time)
+        sig.value_ids.append(vid)
+        sig.num += 1
+
+        if len(sig.times) > STORE_SPOOL_CHANGES:
+            self.flush(sig, len(sig.times) - 1)
+
+    def flush(self, sig, num):
+        if not num:
+            return
+
+        self.spool.seek(self.spool_size)
+        sig.times[:num].tofile(self.spool)
+        sig.value_ids[:num].tofile(self.spool)
+        sig.chunks.append((self.spool_size, num))
+        self.spool_size += num * 12
+
+        del sig.times[:num]
+        del sig.value_ids[:num]
+
+    def convert(self):
+        with open(self.trace_fn) as f:
+            for line in f:
+                self.parse_line(line)
+
+        self.write()
+
+    def write(self):
+        sigs = list({id(s): s for s in self.signals.values()}.values())
+        sig_ids = {id(s): i for i, s in enumerate(sigs)}
+        names = list(self.signals.keys())
+
+        for s in sigs:
+            self.flush(s, len(s.times))
+
+        tmp_fn = self.store_fn + '.tmp'
+        with open(tmp_fn, 'wb') as f:
+            f.write(b'\x00' * STORE_HEADER.size)
+
+            names_off = f.tell()
+            array('Q', [sig_ids[id(self.signals[n])] for n in names]).tofile(f)
+            _write_str_table(f, names)
+
+            vals_off = f.tell()
+            self.value_offsets.flush()
+            self.value_blob.flush()
+            _copy(self.value_offsets, 0, (self.values_num + 1) * 8, f)
+            _copy(self.value_blob, 0, self.values_size, f)
+            _align(f)
+
+            sigs_off = f.tell()
+            f.write(b'\x00' * (STORE_SIGNAL.size * len(sigs)))
+
+            self.spool.flush()
+            sig_entries = []
+            for s in sigs:
+                times_off = f.tell()
+                for offset, num in s.chunks:
+                    _copy(self.spool, offset, num * 8, f)
+
+                values_off = f.tell()
+                for offset, num in s.chunks:
+                    _copy(self.spool, offset + num * 8, num * 4, f)
+
+                _align(f)
+                sig_entries.append(STORE_SIGNAL.pack(len(s), times_off, values_off))
+
+            f.seek(sigs_off)
+            f.write(b''.join(sig_entries))
+
+            f.seek(0)
+            f.write(
+                STORE_HEADER.pack(STORE_MAGIC, len(names), len(sigs), self.values_num, names_off,
+                                  sigs_off, vals_off))
+
+        os.replace(tmp_fn, self.store_fn)
+
+    def close(self):
+        self.spool.close()
+        self.value_offsets.close()
+        self.value_blob.close()
+
+
+def vcd_to_store(trace_fn, store_fn=None):
+    if store_fn is None:
+        store_fn = store_path(trace_fn)
+
+    writer = StoreWriter(trace_fn, store_fn)
+    try:
+        writer.convert()
+    finally:
+        writer.close()
+
+    return store_fn
+
+
+class StrTable:
+    def __init__(self, buf, offset, num):
+        self.num = num
+        self.offsets = buf[offset:offset + (num + 1) * 8].cast('Q')
+        self.blob = offset + (num + 1) * 8
+        self.buf = buf
+
+    def __len__(self):
+        return self.num
+
+    def __getitem__(self, i):
+        start = self.blob + self.offsets[i]
+        end = self.blob + self.offsets[i + 1]
+        return bytes(self.buf[start:end]).decode()
+
+
+class StoreSignal:
+    __slots__ = ('times', 'value_ids', 'value_table')
+
+    def __init__(self, times, value_ids, value_table):
+        self.times = times
+        self.value_ids = value_ids
+        self.value_table = value_table
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def values(self):
+        return [self.value_table[v] for v in self.value_ids]
+
+    def value_at(self, time):
+        i = bisect.bisect_right(self.times, time) - 1
+        if i < 0:
+            return None
+
+        return self.value_table[self.value_ids[i]]
+
+
+class VCDStore:
+    """Read-only, memory-mapped columnar trace store created by
+    :func:`vcd_to_store`. Only the header is read on open, signal columns are
+    paged in by the OS when they are accessed.
+    """
+
+    def __init__(self, store_fn):
+        self.store_fn = store_fn
+        self._f = open(store_fn, 'rb')
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mm)
+
+        (magic, self.names_num, self.sigs_num, vals_num, names_off, self.sigs_off,
+         vals_off) = STORE_HEADER.unpack_from(self._mm)
+
+        if magic != STORE_MAGIC:
+            self._buf.release()
+            self._mm.close()
+            self._f.close()
+            raise ValueError(f'"{store_fn}" is not a Gearbox waveform store')
+
+        self._name_sigs = self._buf[names_off:names_off + self.names_num * 8].cast('Q')
+        self._names = StrTable(self._buf, names_off + self.names_num * 8, self.names_num)
+        self.value_table = StrTable(self._buf, vals_off, vals_num)
+        self._name_map = None
+        self._sigs = {}
+
+    @property
+    def name_map(self):
+        if self._name_map is None:
+            self._name_map = {self._names[i]: i for i in range(self.names_num)}
+
+        return self._name_map
+
+    @property
+    def names(self):
+        return self.name_map.keys()
+
+    def __contains__(self, name):
+        return name in self.name_map
+
+    def __getitem__(self, name):
+        sig_id = self._name_sigs[self.name_map[name]]
+        if sig_id not in self._sigs:
+            num, times_off, values_off = STORE_SIGNAL.unpack_from(
+                self._mm, self.sigs_off + sig_id * STORE_SIGNAL.size)
+
+            self._sigs[sig_id] = StoreSignal(self._buf[times_off:times_off + num * 8].cast('Q'),
+                                             self._buf[values_off:values_off + num * 4].cast('I'),
+                                             self.value_table)
+
+        return self._sigs[sig_id]
+
+    def value_at(self, name, time):
+        try:
+            return self[name].value_at(time)
+        except KeyError:
+            return None
+
+    def reload(self):
+        return ''
+
+    def close(self):
+        self._sigs.clear()
+        self._f.close()
+
+        # Signal columns might still be referenced, in which case the mapping
+        # is closed once they are garbage collected
+        try:
+            self._name_sigs.release()
+            self._names.offsets.release()
+            self.value_table.offsets.release()
+            self._buf.release()
+            self._mm.close()
+        except BufferError:
+            pass
+
+
+if __name__ == '__main__':
+    for fn in sys.argv[1:]:
+        print(f'{fn} -> {vcd_to_store(fn)}')